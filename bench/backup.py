@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from backup import EXPORT_TABLES, export_db, import_db  # noqa: E402
+from storage import ADD_EVENT_SQL, ADD_STATS_SQL, SCHEMA_SQLS, StatsRepository  # noqa: E402
+
+
+def seed(db_file: Path, rows: int, users: int, seed: int) -> None:
+    # 作業ログと stats だけを直接入れる (ロールアップは StatsRepository.init の補完で作られる)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_file)
+    for sql in SCHEMA_SQLS:
+        conn.execute(sql)
+    totals: dict[int, list[int]] = {}
+    events = []
+    for i in range(rows):
+        user_id, minutes = rng.randrange(users), rng.randint(1, 50)
+        events.append((user_id, rng.randrange(20), 28_000_000 + i // 10, minutes, 1))
+        total = totals.setdefault(user_id, [0, 0])
+        total[0] += minutes
+        total[1] += 1
+    conn.executemany(ADD_EVENT_SQL, events)
+    conn.executemany(ADD_STATS_SQL, [(uid, m, s) for uid, (m, s) in totals.items()])
+    conn.commit()
+    conn.close()
+
+
+def table_digest(db_file: Path) -> dict[str, tuple]:
+    conn = sqlite3.connect(db_file)
+    try:
+        return {
+            table: conn.execute(
+                f"SELECT COUNT(*), {', '.join(f'TOTAL({c})' for c in columns)} FROM {table}"
+            ).fetchone()
+            for table, columns in EXPORT_TABLES.items()
+        }
+    finally:
+        conn.close()
+
+
+def measure(fn, *args) -> tuple[object, float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+async def export_while_writing(db_file: Path, out: Path, users: int) -> tuple[float, float, int, bool]:
+    # Bot と同じ接続設定で加算し続けながら書き出し、書き込みの最大待ち時間と写しの整合性を見る
+    stats = StatsRepository(str(db_file), flush_interval=0, flush_threshold=1)
+    stats.FLUSH_COALESCE_SECONDS = 0
+    await stats.init()
+    stop = asyncio.Event()
+    worst = 0.0
+    writes = 0
+
+    async def writer() -> None:
+        nonlocal worst, writes
+        rng = random.Random(0)
+        while not stop.is_set():
+            start = time.perf_counter()
+            await stats.add_work_minutes([rng.randrange(users)], 25)
+            await stats.flush()
+            worst = max(worst, time.perf_counter() - start)
+            writes += 1
+            await asyncio.sleep(0.001)
+
+    task = asyncio.create_task(writer())
+    await asyncio.sleep(1.0)
+    idle_worst, worst = worst, 0.0
+    await asyncio.to_thread(export_db, db_file, out)
+    stop.set()
+    await task
+    await stats.close()
+
+    # 書き出した stats の合計が同じファイル内の作業ログの合計と一致すれば、途中の書き込みが混ざっていない
+    sums = {"stats": 0, "work_events": 0}
+    with gzip.open(out, "rt", encoding="utf-8") as f:
+        next(f)
+        for line in f:
+            record = json.loads(line)
+            if record["table"] == "stats":
+                sums["stats"] += record["row"][1]
+            elif record["table"] == "work_events":
+                sums["work_events"] += record["row"][3]
+    return idle_worst, worst, writes, sums["stats"] == sums["work_events"]
+
+
+async def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source = tmp / "pomo.db"
+        seed(source, args.rows, args.users, args.seed)
+        stats = StatsRepository(str(source), flush_interval=0)
+        await stats.init()
+        await stats.close()
+        expected = table_digest(source)
+
+        print(f"backup                   : {args.rows} work_events, {args.users} users")
+        for name in ("pomo.jsonl.gz", "pomo.zip"):
+            out = tmp / name
+            counts, export_time, export_peak = measure(export_db, source, out)
+            target = tmp / f"restored-{name}.db"
+            _, import_time, import_peak = measure(import_db, target, out)
+            ok = table_digest(target) == expected
+            print(f"{name:<25}: {sum(counts.values())} rows, {out.stat().st_size / 1e6:.1f}MB | "
+                  f"export {export_time:.2f}s peak {export_peak / 1e6:.1f}MB | "
+                  f"import {import_time:.2f}s peak {import_peak / 1e6:.1f}MB | round trip {'ok' if ok else 'MISMATCH'}")
+
+        merged = tmp / "merged.db"
+        import_db(merged, tmp / "pomo.zip")
+        import_db(merged, tmp / "pomo.jsonl.gz", "add")
+        doubled = table_digest(merged)["stats"][2] == expected["stats"][2] * 2
+        print(f"add mode                 : stats total doubled {'ok' if doubled else 'MISMATCH'}")
+
+        idle, worst, writes, consistent = await export_while_writing(source, tmp / "live.jsonl.gz", args.users)
+        print(f"export under writes      : {writes} flushes, worst {worst * 1000:.1f}ms (idle {idle * 1000:.1f}ms), "
+              f"snapshot {'consistent' if consistent else 'INCONSISTENT'}")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="統計の書き出し・読み込みの速度とメモリ、書き込み中の整合性を測る")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from charts import HISTORY_DAYS, ChartRenderer  # noqa: E402
+from heatmap import render_stats  # noqa: E402
+from shard import ShardRouter  # noqa: E402
+from storage import StatsRepository  # noqa: E402
+
+
+async def seed(stats: StatsRepository, users: int, seed: int) -> None:
+    # 1年分の日別集計を直接入れる (作業ログを1件ずつ加算するより速い)
+    rng = random.Random(seed)
+    today = stats._day_of(stats._current_minute())
+    rows = [
+        (user_id, day, 1, rng.choice((0, 0, 25, 50, 75, 100, 150, 200)), 1)
+        for user_id in range(users)
+        for day in range(today - HISTORY_DAYS + 1, today + 1)
+    ]
+    await stats.db.executemany(
+        "INSERT INTO daily_stats (user_id, day, guild_id, minutes, sessions) VALUES (?, ?, ?, ?, ?)",
+        [row for row in rows if row[3] > 0],
+    )
+    await stats.db.commit()
+
+
+async def loop_lag(stop: asyncio.Event) -> float:
+    # 10ms ごとに起きるタイマーが、どれだけ遅れたか (描画でループが止まった時間)
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - start - 0.01)
+    return worst
+
+
+async def render_all(users: int, render) -> tuple[float, float]:
+    stop = asyncio.Event()
+    lag = asyncio.create_task(loop_lag(stop))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await asyncio.gather(*(render(user_id) for user_id in range(users)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, await lag
+
+
+async def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = StatsRepository(str(Path(tmp) / "pomo.db"), flush_interval=0)
+        await stats.init()
+        await seed(stats, args.users, args.seed)
+        router = ShardRouter(None, stats)
+        charts = ChartRenderer(router, workers=args.workers)
+
+        async def inline(user_id: int) -> None:
+            today, rows = await router.get_daily_minutes(user_id, HISTORY_DAYS)
+            render_stats(today, [d for d, _ in rows], [m for _, m in rows])
+
+        # 描画プロセスの起動時間を計測から外す
+        await charts.render(args.users)
+
+        inline_time, inline_lag = await render_all(args.users, inline)
+        pool_time, pool_lag = await render_all(args.users, charts.render)
+        cached_time, cached_lag = await render_all(args.users, charts.render)
+
+        await stats.add_work_minutes([0], 25)
+        rendered = charts.rendered
+        png, summary = await charts.render(0)
+        invalidated = charts.rendered - rendered
+
+        out = Path(args.out)
+        out.write_bytes(png)
+        charts.close()
+        await stats.close()
+
+    print(f"charts                   : {args.users} users x {HISTORY_DAYS} days, workers {args.workers}")
+    print(f"inline on the loop       : {inline_time * 1000:.0f}ms total, loop stalled up to {inline_lag * 1000:.1f}ms")
+    print(f"process pool             : {pool_time * 1000:.0f}ms total, loop stalled up to {pool_lag * 1000:.1f}ms")
+    print(f"cached                   : {cached_time * 1000:.0f}ms total, loop stalled up to {cached_lag * 1000:.1f}ms "
+          f"(hits {charts.cache_hits})")
+    print(f"re-rendered after credit : {invalidated}")
+    print(f"png                      : {len(png)} bytes -> {out}")
+    print(f"summary (user 0)         : {summary}")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="!stats chart の描画をイベントループ上と別プロセスで比べる")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=ChartRenderer.MAX_WORKERS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=str(Path(tempfile.gettempdir()) / "pomo-stats.png"))
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from typing import Callable
+
+import discord
+
+
+class FakeResponse:
+    def __init__(self, status: int, headers: dict[str, str]):
+        self.status = status
+        self.reason = "Too Many Requests" if status == 429 else "OK"
+        self.headers = headers
+
+
+class FakeHTTP:
+    # Discordのチャンネル単位レート制限 (5件/5秒) を模したローカルHTTP層
+    def __init__(self, rate: int = 5, per: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.per = per
+        self.clock = clock
+        self._history: dict[int, list[float]] = {}
+        self.requests: list[tuple[str, int, dict]] = []
+        self.times: list[float] = []
+        self.rejected = 0
+
+    def request(self, method: str, channel_id: int, payload: dict) -> None:
+        now = self.clock()
+        window = [t for t in self._history.get(channel_id, []) if now - t < self.per]
+        if len(window) >= self.rate:
+            self.rejected += 1
+            reset_after = self.per - (now - window[0])
+            raise discord.HTTPException(
+                FakeResponse(429, {"X-RateLimit-Reset-After": f"{reset_after:.3f}"}),
+                {"message": "You are being rate limited.", "code": 0},
+            )
+        window.append(now)
+        self._history[channel_id] = window
+        self.requests.append((method, channel_id, payload))
+        self.times.append(now)
+
+    async def wait_turn(self, channel_id: int) -> None:
+        # discord.py はレート制限のバケットを覚えていて、上限に達したら送る前に待つ (429 にはしない)
+        while True:
+            now = self.clock()
+            window = [t for t in self._history.get(channel_id, []) if now - t < self.per]
+            if len(window) < self.rate:
+                return
+            await asyncio.sleep(self.per - (now - window[0]))
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, channel: "FakeChannel", content: str | None = None, view=None):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.content = content
+        self.view = view
+        self.edits = 0
+
+    async def edit(self, **kwargs) -> "FakeMessage":
+        self.channel.http.request("PATCH", self.channel.id, kwargs)
+        self.content = kwargs.get("content", self.content)
+        self.view = kwargs.get("view", self.view)
+        self.edits += 1
+        return self
+
+
+class FakeChannel:
+    _ids = itertools.count(1)
+
+    def __init__(self, http: FakeHTTP):
+        self.id = next(self._ids)
+        self.http = http
+        self.messages: list[FakeMessage] = []
+        self._by_id: dict[int, FakeMessage] = {}
+
+    async def send(self, content: str | None = None, **kwargs) -> FakeMessage:
+        self.http.request("POST", self.id, {"content": content, **kwargs})
+        message = FakeMessage(self, content, kwargs.get("view"))
+        self.messages.append(message)
+        self._by_id[message.id] = message
+        return message
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return self._by_id[message_id]
+
+
+class FakeVoiceState:
+    def __init__(self, channel: "FakeVoiceChannel | None"):
+        self.channel = channel
+
+
+class FakeMember:
+    def __init__(self, user_id: int, guild: "FakeGuild", bot: bool = False):
+        self.id = user_id
+        self.guild = guild
+        self.bot = bot
+        self.voice: FakeVoiceState | None = None
+        self.mention = f"<@{user_id}>"
+        self.display_name = f"user{user_id}"
+
+
+class FakeVoiceClient:
+    AUDIO_SECONDS = 1.0
+
+    def __init__(self, channel: "FakeVoiceChannel"):
+        self.channel = channel
+        self.guild = channel.guild
+        self._connected = True
+        self._playing = None
+        self.plays = 0
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_playing(self) -> bool:
+        return self._playing is not None
+
+    def play(self, source, *, after=None) -> None:
+        self.plays += 1
+        loop = asyncio.get_running_loop()
+
+        def finish() -> None:
+            self._playing = None
+            if after is not None:
+                after(None)
+
+        self._playing = loop.call_later(self.AUDIO_SECONDS, finish)
+
+    def stop(self) -> None:
+        if self._playing is not None:
+            self._playing.cancel()
+            self._playing = None
+
+    async def move_to(self, channel: "FakeVoiceChannel") -> None:
+        self.channel = channel
+
+    async def disconnect(self, force: bool = False) -> None:
+        self.stop()
+        self._connected = False
+        if self.guild.voice_client is self:
+            self.guild.voice_client = None
+
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id: int, guild: "FakeGuild"):
+        self.id = channel_id
+        self.guild = guild
+        self.voice_states: dict[int, FakeVoiceState] = {}
+        self.connects = 0
+
+    @property
+    def members(self) -> list[FakeMember]:
+        return [self.guild.members[uid] for uid in self.voice_states if uid in self.guild.members]
+
+    async def connect(self, *, reconnect: bool = True, **kwargs) -> FakeVoiceClient:
+        self.connects += 1
+        client = FakeVoiceClient(self)
+        self.guild.voice_client = client
+        return client
+
+    def join(self, member: FakeMember) -> tuple[FakeVoiceState, FakeVoiceState]:
+        before = member.voice or FakeVoiceState(None)
+        member.voice = FakeVoiceState(self)
+        self.voice_states[member.id] = member.voice
+        return before, member.voice
+
+    def leave(self, member: FakeMember) -> tuple[FakeVoiceState, FakeVoiceState]:
+        before = member.voice or FakeVoiceState(None)
+        member.voice = None
+        self.voice_states.pop(member.id, None)
+        return before, FakeVoiceState(None)
+
+
+class FakeGuild:
+    _ids = itertools.count(1)
+
+    def __init__(self):
+        self.id = next(self._ids)
+        self.members: dict[int, FakeMember] = {}
+        self.voice_client: FakeVoiceClient | None = None
+
+    def get_member(self, user_id: int) -> FakeMember | None:
+        return self.members.get(user_id)
+
+    def get_channel(self, channel_id: int):
+        return None
+
+    def add_member(self, user_id: int) -> FakeMember:
+        member = FakeMember(user_id, self)
+        self.members[user_id] = member
+        return member
+
+
+class FakeContext:
+    def __init__(self, author: FakeMember, channel: FakeChannel):
+        self.author = author
+        self.guild = author.guild
+        self.channel = channel
+
+    @property
+    def voice_client(self) -> FakeVoiceClient | None:
+        return self.guild.voice_client
+
+    async def send(self, content: str | None = None, **kwargs) -> FakeMessage:
+        # コマンドの返信は Outbox を通らず discord.py から直接送られる
+        await self.channel.http.wait_turn(self.channel.id)
+        return await self.channel.send(content, **kwargs)
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from shard import ShardLayout, ShardRouter, ShardUnavailable  # noqa: E402
+from storage import StatsRepository  # noqa: E402
+from supervisor import ShardSupervisor  # noqa: E402
+
+
+def gateway_events(seed: int, count: int, guilds: int, users: int) -> list[tuple[int, int, int]]:
+    # (guild_id, user_id, minutes)。guild_id は本物と同じくシャード番号が上位ビットから決まる snowflake
+    rng = random.Random(seed)
+    guild_ids = [(rng.getrandbits(40) << 22) | rng.getrandbits(22) for _ in range(guilds)]
+    user_ids = [10_000 + i for i in range(users)]
+    return [(rng.choice(guild_ids), rng.choice(user_ids), rng.randint(1, 25)) for _ in range(count)]
+
+
+def expected_totals(events: list[tuple[int, int, int]]) -> dict[int, int]:
+    totals: dict[int, int] = {}
+    for _, user_id, minutes in events:
+        totals[user_id] = totals.get(user_id, 0) + minutes
+    return totals
+
+
+async def worker(args: argparse.Namespace) -> None:
+    # supervisor から起動される1プロセス分。Discord の代わりに自分のシャードのイベントだけを受け取る
+    layout = ShardLayout.from_env()
+    stats = StatsRepository(layout.db_file(args.db))
+    await stats.init()
+    router = ShardRouter(layout, stats)
+
+    async with stats.db.execute("SELECT COUNT(*) FROM work_events") as cursor:
+        (existing,) = await cursor.fetchone()
+    applied = 0
+    if existing == 0:
+        for guild_id, user_id, minutes in gateway_events(args.seed, args.events, args.guilds, args.users):
+            if layout.owner_of(guild_id) != layout.process_index:
+                continue
+            await stats.add_work_minutes([user_id], minutes, guild_id)
+            applied += 1
+        # 強制終了されても再起動後に同じ値を返せるようにすぐ書き込む
+        await stats.flush()
+
+    async def ping(request: web.Request) -> web.Response:
+        return web.json_response({"index": layout.process_index, "pid": os.getpid(), "applied": applied})
+
+    async def routed_stats(request: web.Request) -> web.Response:
+        try:
+            row = await router.get_stats(int(request.match_info["user_id"]))
+        except ShardUnavailable:
+            return web.json_response({"error": "unavailable"}, status=503)
+        return web.json_response({"row": row})
+
+    async def routed_daily(request: web.Request) -> web.Response:
+        try:
+            _, rows = await router.get_daily_minutes(int(request.match_info["user_id"]), 7)
+        except ShardUnavailable:
+            return web.json_response({"error": "unavailable"}, status=503)
+        return web.json_response({"days": rows})
+
+    async def stall(request: web.Request) -> web.Response:
+        # 重いギルドでイベントループが詰まった状態を再現する
+        time.sleep(float(request.query.get("seconds", "1")))
+        return web.json_response({"stalled": True})
+
+    router.app.router.add_get("/fake/ping", ping)
+    router.app.router.add_get("/fake/stats/{user_id}", routed_stats)
+    router.app.router.add_get("/fake/daily/{user_id}", routed_daily)
+    router.app.router.add_get("/fake/stall", stall)
+    await router.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    await router.close()
+    await stats.close()
+
+
+async def get_json(client: aiohttp.ClientSession, url: str) -> tuple[int, dict]:
+    async with client.get(url) as response:
+        return response.status, await response.json()
+
+
+async def wait_ready(client: aiohttp.ClientSession, layout: ShardLayout, index: int, timeout: float = 20.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return (await get_json(client, f"http://{layout.host}:{layout.port(index)}/fake/ping"))[1]
+        except aiohttp.ClientError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def check_totals(client: aiohttp.ClientSession, layout: ShardLayout, totals: dict[int, int]) -> int:
+    mismatches = 0
+    for user_id, minutes in totals.items():
+        status, body = await get_json(client, f"http://{layout.host}:{layout.port(0)}/fake/stats/{user_id}")
+        if status != 200 or body["row"][0] != minutes:
+            mismatches += 1
+    return mismatches
+
+
+async def check_daily(client: aiohttp.ClientSession, layout: ShardLayout, totals: dict[int, int]) -> int:
+    # イベントはすべて今日の分として入るので、全プロセス合算の日別合計は累計と一致する
+    mismatches = 0
+    for user_id, minutes in totals.items():
+        status, body = await get_json(client, f"http://{layout.host}:{layout.port(0)}/fake/daily/{user_id}")
+        if status != 200 or sum(m for _, m in body["days"]) != minutes:
+            mismatches += 1
+    return mismatches
+
+
+async def harness(args: argparse.Namespace) -> None:
+    events = gateway_events(args.seed, args.events, args.guilds, args.users)
+    totals = expected_totals(events)
+    with tempfile.TemporaryDirectory() as tmp:
+        command = [
+            sys.executable, __file__, "worker",
+            "--db", str(Path(tmp) / "pomo.db"),
+            "--seed", str(args.seed),
+            "--events", str(args.events),
+            "--guilds", str(args.guilds),
+            "--users", str(args.users),
+        ]
+        supervisor = ShardSupervisor(command, args.processes, args.shards, base_port=args.base_port)
+        supervisor.RESTART_BACKOFF_SECONDS = (0.5,)
+        running = asyncio.create_task(supervisor.run())
+        layout = supervisor.layout(0)
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as client:
+                started = time.perf_counter()
+                pings = [await wait_ready(client, layout, i) for i in range(args.processes)]
+                print(f"processes ready          : {args.processes} x shards {[layout.shard_ids_of(i) for i in range(args.processes)]} "
+                      f"in {time.perf_counter() - started:.2f}s")
+                print(f"events per process       : {[p['applied'] for p in pings]} (total {sum(p['applied'] for p in pings)} / {len(events)})")
+                print(f"routed !stats mismatches : {await check_totals(client, layout, totals)} / {len(totals)} users")
+                print(f"routed daily mismatches  : {await check_daily(client, layout, totals)} / {len(totals)} users")
+
+                # 1プロセスのループを止めても他のプロセスは応答し続ける
+                stall = asyncio.create_task(get_json(client, f"http://{layout.host}:{layout.port(0)}/fake/stall?seconds=2"))
+                await asyncio.sleep(0.2)
+                latencies = []
+                for index in range(1, args.processes):
+                    t = time.perf_counter()
+                    await get_json(client, f"http://{layout.host}:{layout.port(index)}/fake/ping")
+                    latencies.append((time.perf_counter() - t) * 1000)
+                await stall
+                print(f"peer ping while p0 stalls: {', '.join(f'{ms:.1f}ms' for ms in latencies)}")
+
+                if args.processes > 1:
+                    os.kill(supervisor.pid(1), signal.SIGKILL)
+                    await asyncio.sleep(0.1)
+                    status, _ = await get_json(client, f"http://{layout.host}:{layout.port(0)}/fake/stats/{next(iter(totals))}")
+                    print(f"!stats while p1 is down  : HTTP {status}")
+                    t = time.perf_counter()
+                    await wait_ready(client, layout, 1)
+                    print(f"p1 restarted             : {time.perf_counter() - t:.2f}s (restarts {supervisor.restarts})")
+                    print(f"mismatches after restart : {await check_totals(client, layout, totals)} / {len(totals)} users")
+        finally:
+            await supervisor.stop()
+            await running
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="偽のゲートウェイでシャード分割・集計の振り分け・再起動を確認する")
+    parser.add_argument("mode", nargs="?", choices=("harness", "worker"), default="harness")
+    parser.add_argument("--processes", type=int, default=3)
+    parser.add_argument("--shards", type=int, default=6)
+    parser.add_argument("--base-port", type=int, default=19200)
+    parser.add_argument("--db", default="")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--users", type=int, default=300)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    asyncio.run(worker(args) if args.mode == "worker" else harness(args))
+
+
+if __name__ == "__main__":
+    main()
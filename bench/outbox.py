@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from fake_discord import FakeChannel, FakeHTTP  # noqa: E402
+from outbox import LOW, URGENT, Outbox  # noqa: E402
+
+
+SESSIONS = 40
+TICKS = 10
+
+
+async def main() -> None:
+    http = FakeHTTP()
+    channel = FakeChannel(http)
+    outbox = Outbox()
+
+    messages = [await outbox.send(channel, content=f"session {i}") for i in range(SESSIONS)]
+    start = time.perf_counter()
+    for tick in range(TICKS):
+        for message in messages:
+            outbox.edit(message, LOW, content=f"残り {TICKS - tick} 分")
+    await outbox.send(channel, URGENT, content="👑 ホストが移行しました。")
+    urgent_latency = time.perf_counter() - start
+
+    while outbox.pending():
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start
+
+    print(f"requested edits : {SESSIONS * TICKS}")
+    print(f"sent edits      : {outbox.edited}")
+    print(f"coalesced       : {outbox.coalesced}")
+    print(f"429 from fake   : {http.rejected} (outbox retries: {outbox.rate_limited})")
+    print(f"urgent latency  : {urgent_latency:.2f}s")
+    print(f"drain time      : {elapsed:.2f}s")
+    print(f"final contents ok: {all(m.content == '残り 1 分' for m in messages)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from session import SessionManager  # noqa: E402
+
+
+MEMBERS_PER_SESSION = 8
+UPDATES = 2000
+
+
+def build(session_count: int) -> SessionManager:
+    manager = SessionManager()
+    for author_id in range(session_count):
+        session = manager.create(author_id)
+        session.active = True
+        for i in range(1, MEMBERS_PER_SESSION):
+            session.add_member(1_000_000 + author_id * MEMBERS_PER_SESSION + i)
+        manager.update_index(author_id)
+    return manager
+
+
+def bench(session_count: int) -> float:
+    manager = build(session_count)
+    author_id = session_count // 2
+    session = manager.get(author_id)
+    extra = 9_000_000_000
+    start = time.perf_counter()
+    for _ in range(UPDATES):
+        session.add_member(extra)
+        manager.update_index(author_id)
+        session.remove_member(extra)
+        manager.update_index(author_id)
+    return (time.perf_counter() - start) / (UPDATES * 2) * 1e6
+
+
+def main() -> None:
+    print(f"{'sessions':>10} {'indexed users':>14} {'update_index (us)':>18}")
+    for session_count in (10, 100, 1_000, 10_000, 50_000):
+        per_call = bench(session_count)
+        print(f"{session_count:>10} {session_count * MEMBERS_PER_SESSION:>14} {per_call:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from session import SessionManager  # noqa: E402
+
+
+SESSIONS = 10_000
+MEMBERS_PER_SESSION = 4
+CHURN_CYCLES = 200
+
+
+def build(manager: SessionManager) -> None:
+    for author_id in range(SESSIONS):
+        session = manager.create(author_id)
+        for i in range(1, MEMBERS_PER_SESSION):
+            session.add_member(1_000_000 + author_id * MEMBERS_PER_SESSION + i)
+        manager.update_index(author_id)
+
+
+def churn(manager: SessionManager) -> None:
+    # 参加と退出を繰り返しても join_order が伸びないことを確かめる
+    for author_id in range(SESSIONS):
+        session = manager.get(author_id)
+        for cycle in range(CHURN_CYCLES):
+            user_id = 5_000_000_000 + cycle
+            session.add_member(user_id)
+            session.remove_member(user_id)
+
+
+def measure(step) -> int:
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    step()
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0] - before
+
+
+def main() -> None:
+    tracemalloc.start()
+    manager = SessionManager()
+    built = measure(lambda: build(manager))
+    churned = measure(lambda: churn(manager))
+    tracemalloc.stop()
+
+    session = manager.get(0)
+    print(f"sessions                 : {SESSIONS} x {MEMBERS_PER_SESSION} members")
+    print(f"has __dict__             : {hasattr(session, '__dict__')}")
+    print(f"bytes per session        : {built / SESSIONS:.0f} (PomoSession + Event + index entries)")
+    print(f"bytes per session after  : {churned / SESSIONS:+.0f} ({CHURN_CYCLES} join/leave cycles each)")
+    print(f"join_order length        : {len(session.join_order)}")
+
+
+if __name__ == "__main__":
+    main()
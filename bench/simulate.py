@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import random
+import selectors
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from audio import AudioPlayer  # noqa: E402
+from charts import ChartRenderer  # noqa: E402
+from cog import PomoCog  # noqa: E402
+from fake_discord import FakeChannel, FakeContext, FakeGuild, FakeHTTP, FakeVoiceChannel  # noqa: E402
+from outbox import Outbox  # noqa: E402
+from presence import VoicePresence  # noqa: E402
+from profiler import SamplingProfiler  # noqa: E402
+from scheduler import TimerScheduler  # noqa: E402
+from session import SessionManager  # noqa: E402
+from shard import ShardRouter  # noqa: E402
+from snapshot import SessionStore  # noqa: E402
+from storage import StatsRepository  # noqa: E402
+from tracing import Tracer  # noqa: E402
+from voice import VoicePool  # noqa: E402
+
+
+# 1セッション・1仮想分あたりのCPU時間の上限。この環境の実測 (100〜1000セッションで約200〜250us) の2倍
+MAX_CPU_US_PER_SESSION_MINUTE = 500.0
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    # 待機すべきタイマーしか無いときは実時間を待たずに仮想時刻を進める
+    def __init__(self, io_pending):
+        super().__init__(selectors.DefaultSelector())
+        self._now = 0.0
+        self._io_pending = io_pending
+        self.iteration_seconds: list[float] = []
+        self._iteration_start = time.perf_counter()
+        real_select = self._selector.select
+
+        def select(timeout=None):
+            self.iteration_seconds.append(time.perf_counter() - self._iteration_start)
+            events = real_select(0)
+            if not events and timeout != 0:
+                if self._io_pending():
+                    # SQLiteスレッドの完了を実時間で待つ (仮想時刻は進めない)
+                    events = real_select(1.0)
+                elif timeout is not None:
+                    # now + timeout は丸めで期限にわずかに届かないことがあるので、次のタイマーの時刻へ直接進める
+                    self._now = self._scheduled[0].when() if self._scheduled else self._now + timeout
+            self._iteration_start = time.perf_counter()
+            return events
+
+        self._selector.select = select
+
+    def time(self) -> float:
+        return self._now
+
+
+class SimStats(StatsRepository):
+    def __init__(self, db_file: str, **kwargs):
+        super().__init__(db_file, **kwargs)
+        self.inflight = 0
+        self.commits = 0
+
+    async def _io(self, coro):
+        self.inflight += 1
+        try:
+            return await coro
+        finally:
+            self.inflight -= 1
+
+    async def init(self) -> None:
+        await self._io(super().init())
+
+    async def flush(self) -> None:
+        if self._pending:
+            self.commits += 1
+        await self._io(super().flush())
+
+    async def close(self) -> None:
+        await self._io(super().close())
+
+
+class SimSnapshots(SessionStore):
+    def __init__(self, db_file: str, **kwargs):
+        super().__init__(db_file, **kwargs)
+        self.inflight = 0
+
+    async def _io(self, coro):
+        self.inflight += 1
+        try:
+            return await coro
+        finally:
+            self.inflight -= 1
+
+    async def init(self) -> None:
+        await self._io(super().init())
+
+    async def flush(self) -> None:
+        await self._io(super().flush())
+
+    async def close(self) -> None:
+        await self._io(super().close())
+
+
+class SimAudio(AudioPlayer):
+    def __init__(self):
+        super().__init__("sim")
+        self.plays = 0
+        self.started: list[float] = []
+
+    def file_exists(self) -> bool:
+        return True
+
+    async def play(self, voice_client, volume: float = 1.0) -> None:
+        # 音声の生成は省くが、開始をずらす処理は本物と同じものを通す
+        await self._wait_turn()
+        self.plays += 1
+        self.started.append(asyncio.get_running_loop().time())
+        finished = asyncio.Event()
+        voice_client.play(None, after=lambda _: finished.set())
+        await finished.wait()
+
+
+class SimSession:
+    def __init__(self, guild: FakeGuild, voice_channel: FakeVoiceChannel, ctx: FakeContext, targets: list):
+        self.guild = guild
+        self.voice_channel = voice_channel
+        self.ctx = ctx
+        self.targets = targets
+        self.task: asyncio.Task | None = None
+
+
+class Simulation:
+    def __init__(self, args: argparse.Namespace, loop: VirtualTimeLoop, db_file: str):
+        self.args = args
+        self.loop = loop
+        self.rng = random.Random(args.seed)
+        self.http = FakeHTTP(clock=loop.time)
+        self.manager = SessionManager()
+        self.tracer = Tracer(enabled=args.trace_ms > 0, slow_ms=args.trace_ms)
+        self.stats = SimStats(db_file, tracer=self.tracer)
+        self.audio = SimAudio()
+        self.scheduler = TimerScheduler(clock=loop.time)
+        self.presence = VoicePresence()
+        self.outbox = Outbox(clock=loop.time, tracer=self.tracer)
+        self.snapshots = SimSnapshots(db_file, clock=loop.time)
+        self.voice = VoicePool(clock=loop.time)
+        router = ShardRouter(None, self.stats)
+        self.cog = PomoCog(
+            None,
+            self.manager,
+            self.stats,
+            self.audio,
+            self.scheduler,
+            self.presence,
+            self.outbox,
+            self.snapshots,
+            self.voice,
+            self.tracer,
+            SamplingProfiler(tempfile.gettempdir()),
+            router,
+            ChartRenderer(router),
+        )
+        self.sessions: list[SimSession] = []
+        self.user_ids = itertools.count(10_000)
+        self.churn_events = 0
+
+    def io_pending(self) -> bool:
+        return self.stats.inflight > 0 or self.snapshots.inflight > 0
+
+    async def setup(self) -> None:
+        await self.stats.init()
+        await self.snapshots.init()
+        for _ in range(self.args.sessions):
+            guild = FakeGuild()
+            voice_channel = FakeVoiceChannel(guild.id, guild)
+            text_channel = FakeChannel(self.http)
+            host = guild.add_member(next(self.user_ids))
+            voice_channel.join(host)
+            ctx = FakeContext(host, text_channel)
+            targets = []
+            for i in range(self.args.members - 1):
+                member = guild.add_member(next(self.user_ids))
+                voice_channel.join(member)
+                if i == 0:
+                    await self.cog.add.callback(self.cog, ctx, member)
+                else:
+                    # 2人目以降は参加ボタン相当 (!add の返信でチャンネルのレート制限に掛からないように)
+                    self.manager.get(host.id).add_member(member.id)
+                    self.manager.update_index(host.id)
+                targets.append(member)
+            self.sessions.append(SimSession(guild, voice_channel, ctx, targets))
+
+    def start(self) -> None:
+        a = self.args
+        for sim in self.sessions:
+            sim.task = self.loop.create_task(
+                self.cog.pomo.callback(self.cog, sim.ctx, a.work, a.short_break, a.long_break, a.interval)
+            )
+
+    async def churn(self) -> None:
+        if self.args.churn <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.rng.expovariate(self.args.churn))
+            sim = self.rng.choice(self.sessions)
+            session = self.manager.get(sim.ctx.author.id)
+            if session is None or not session.active:
+                continue
+            self.churn_events += 1
+            action = self.rng.random()
+            if action < 0.4 and sim.targets:
+                member = self.rng.choice(sim.targets)
+                if member.voice is not None:
+                    before, after = sim.voice_channel.leave(member)
+                else:
+                    before, after = sim.voice_channel.join(member)
+                await self.cog.on_voice_state_update(member, before, after)
+                if member.voice is not None and session.add_member(member.id):
+                    self.manager.update_index(sim.ctx.author.id)
+            elif action < 0.7:
+                if session.timer is not None and not session.paused and not session.stopped:
+                    session.pause()
+                    self.loop.call_later(self.rng.uniform(10, 120), self._resume, session, session.timer)
+            else:
+                # 何もしない在席者の揺らぎとして再照合のみ行う
+                self.presence.reconcile(sim.voice_channel)
+
+    def _resume(self, session, timer) -> None:
+        # 同じフェーズの間だけ再開ボタンを押したことにする
+        if session.timer is timer and session.paused and not session.stopped:
+            session.resume()
+
+    async def stop_all(self) -> None:
+        for sim in self.sessions:
+            session = self.manager.get(sim.ctx.author.id)
+            if session is None:
+                continue
+            if session.timer is not None:
+                session.request_stop()
+            else:
+                session.stop_requested = True
+                session.notify()
+        await asyncio.gather(*(sim.task for sim in self.sessions if sim.task), return_exceptions=True)
+        while self.outbox.pending():
+            await asyncio.sleep(1)
+        await self.voice.close()
+        await self.snapshots.close()
+        await self.stats.close()
+        self.scheduler.close()
+
+
+async def run(args: argparse.Namespace, loop: VirtualTimeLoop, db_file: str, holder: list) -> None:
+    sim = Simulation(args, loop, db_file)
+    holder.append(sim)
+    await sim.setup()
+    # 準備で送った !add の返信は集計に含めない (レート制限の履歴は残す)
+    sim.http.requests.clear()
+    sim.http.times.clear()
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    loop.iteration_seconds.clear()
+    sim.start()
+    churn = loop.create_task(sim.churn())
+    await asyncio.sleep(args.minutes * 60)
+    churn.cancel()
+    await sim.stop_all()
+    sim.cpu_seconds = time.process_time() - cpu_start
+    sim.wall_seconds = time.perf_counter() - wall_start
+
+
+def per_second(times: list[float]) -> str:
+    # 同じ区切りに集中した処理が1秒あたりいくつ重なったか (何かが起きた秒だけで数える)
+    buckets: dict[int, int] = {}
+    for t in times:
+        buckets[int(t)] = buckets.get(int(t), 0) + 1
+    counts = sorted(buckets.values()) or [0]
+    return f"p99 {counts[min(len(counts) - 1, int(len(counts) * 0.99))]}/s, max {counts[-1]}/s"
+
+
+def report(args: argparse.Namespace, sim: Simulation, loop: VirtualTimeLoop) -> None:
+    minutes = args.minutes
+    iterations = sorted(loop.iteration_seconds) or [0.0]
+    p99 = iterations[min(len(iterations) - 1, int(len(iterations) * 0.99))]
+    edits = sum(1 for method, _, _ in sim.http.requests if method == "PATCH")
+    sends = sum(1 for method, _, _ in sim.http.requests if method == "POST")
+    credited = sum(sum(s.session_work.values()) for s in (sim.manager.get(x.ctx.author.id) for x in sim.sessions) if s)
+
+    print(f"sessions                 : {args.sessions} x {args.members} members")
+    print(f"simulated time           : {minutes} min ({args.work}/{args.short_break}/{args.long_break}/{args.interval})")
+    print(f"wall time                : {sim.wall_seconds:.2f}s")
+    print(f"cpu per session          : {sim.cpu_seconds / args.sessions * 1000:.3f}ms total, "
+          f"{sim.cpu_seconds / args.sessions / minutes * 1e6:.1f}us per simulated minute")
+    print(f"loop iteration (tick lag): p99 {p99 * 1000:.3f}ms / max {iterations[-1] * 1000:.3f}ms")
+    print(f"scheduler lag (virtual)  : mean {sim.scheduler.mean_lag * 1000:.3f}ms / max {sim.scheduler.max_lag * 1000:.3f}ms")
+    print(f"db commits per minute    : {sim.stats.commits / minutes:.2f}")
+    print(f"snapshot commits per min : {sim.snapshots.writes / minutes:.2f}")
+    print(f"message edits per minute : {edits / minutes:.2f} (coalesced {sim.outbox.coalesced}, 429 {sim.http.rejected})")
+    print(f"message sends per minute : {sends / minutes:.2f}")
+    print(f"discord requests         : {per_second(sim.http.times)} (paced {sim.outbox.paced})")
+    print(f"audio plays              : {sim.audio.plays} ({per_second(sim.audio.started)})")
+    print(f"voice connects           : {sim.voice.connects} (reused {sim.voice.reuses})")
+    print(f"credited work minutes    : {credited}")
+    print(f"churn events             : {sim.churn_events}")
+    if sim.tracer.enabled:
+        print(f"trace spans              : {sim.tracer.spans} (slow {sim.tracer.slow})")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="仮想時刻で PomoRunner を負荷試験する")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--members", type=int, default=4)
+    parser.add_argument("--minutes", type=float, default=130)
+    parser.add_argument("--work", type=int, default=25)
+    parser.add_argument("--short-break", type=int, default=5)
+    parser.add_argument("--long-break", type=int, default=15)
+    parser.add_argument("--interval", type=int, default=4)
+    parser.add_argument("--churn", type=float, default=0.5, help="1秒あたりの参加/退出/一時停止イベント数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--max-cpu-us",
+        type=float,
+        default=MAX_CPU_US_PER_SESSION_MINUTE,
+        help="1セッション・1仮想分あたりのCPU時間 (us) がこれを超えたら終了コード1で終わる (0で無効)",
+    )
+    parser.add_argument("--trace-ms", type=float, default=0, help="指定するとこのミリ秒を超えたスパンを [TRACE] で出力する")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    holder: list[Simulation] = []
+    loop = VirtualTimeLoop(lambda: bool(holder) and holder[0].io_pending())
+    asyncio.set_event_loop(loop)
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            loop.run_until_complete(run(args, loop, str(Path(tmp) / "sim.db"), holder))
+        finally:
+            remaining = asyncio.all_tasks(loop)
+            for task in remaining:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*remaining, return_exceptions=True))
+            loop.close()
+    report(args, holder[0], loop)
+    sim = holder[0]
+    cpu_us = sim.cpu_seconds / args.sessions / args.minutes * 1e6
+    if args.max_cpu_us > 0 and cpu_us > args.max_cpu_us:
+        sys.exit(f"regression: cpu per simulated minute {cpu_us:.1f}us > {args.max_cpu_us:g}us")
+
+
+if __name__ == "__main__":
+    main()
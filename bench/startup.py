@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from audio import DEFAULT_SOUND_FILE, AudioPlayer  # noqa: E402
+from charts import ChartRenderer  # noqa: E402
+from shard import ShardRouter  # noqa: E402
+from snapshot import SessionStore  # noqa: E402
+from storage import StatsRepository  # noqa: E402
+
+IMPORT_PROBE = """
+import sys, time
+t = time.perf_counter()
+import timer
+elapsed = time.perf_counter() - t
+print(elapsed, *(name in sys.modules for name in ("numpy", "zipfile", "concurrent.futures.process")))
+"""
+
+
+def import_times(runs: int) -> tuple[float, list[bool]]:
+    # 毎回新しいプロセスで timer を読み込む (2回目以降は .pyc があるので再起動と同じ条件)
+    samples = []
+    loaded: list[bool] = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE], cwd=SRC_DIR, capture_output=True, text=True, check=True
+        ).stdout.split()
+        samples.append(float(out[0]))
+        loaded = [flag == "True" for flag in out[1:]]
+    return statistics.median(samples), loaded
+
+
+async def fake_login(seconds: float) -> None:
+    # Discord へのログイン (HTTP 1往復) の代わり
+    await asyncio.sleep(seconds)
+
+
+async def init_once(db_file: str, login_seconds: float, concurrent: bool) -> float:
+    stats = StatsRepository(db_file, flush_interval=0)
+    snapshots = SessionStore(db_file, flush_interval=0)
+    audio = AudioPlayer(DEFAULT_SOUND_FILE)
+    start = time.perf_counter()
+    if concurrent:
+        await asyncio.gather(
+            asyncio.gather(stats.init(), snapshots.init()),
+            audio.load(),
+            fake_login(login_seconds),
+        )
+    else:
+        await stats.init()
+        await snapshots.init()
+        await audio.load()
+        await fake_login(login_seconds)
+    elapsed = time.perf_counter() - start
+    await snapshots.close()
+    await stats.close()
+    return elapsed
+
+
+async def first_chart(db_file: str, prewarm: bool) -> float:
+    stats = StatsRepository(db_file, flush_interval=0)
+    await stats.init()
+    charts = ChartRenderer(ShardRouter(None, stats))
+    if prewarm:
+        await asyncio.gather(stats.prewarm(), charts.prewarm())
+    start = time.perf_counter()
+    await charts.render(1)
+    elapsed = time.perf_counter() - start
+    charts.close()
+    await stats.close()
+    return elapsed
+
+
+async def main(args: argparse.Namespace) -> None:
+    median, (numpy, zipfile, process_pool) = import_times(args.runs)
+    print(f"import timer             : median {median * 1000:.0f}ms over {args.runs} fresh processes")
+    print(f"loaded at import         : numpy={numpy} zipfile={zipfile} concurrent.futures.process={process_pool}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for concurrent in (False, True):
+            samples = [
+                await init_once(str(Path(tmp) / f"init-{concurrent}-{i}.db"), args.login_ms / 1000, concurrent)
+                for i in range(args.runs)
+            ]
+            label = "concurrent" if concurrent else "sequential"
+            print(f"init ({label:<10})    : median {statistics.median(samples) * 1000:.0f}ms "
+                  f"(db + snapshots + audio + login {args.login_ms:.0f}ms)")
+
+        db_file = str(Path(tmp) / "chart.db")
+        stats = StatsRepository(db_file, flush_interval=0)
+        await stats.init()
+        await stats.add_work_minutes([1], 25)
+        await stats.close()
+        cold = await first_chart(db_file, prewarm=False)
+        warm = await first_chart(db_file, prewarm=True)
+        print(f"first !stats chart       : cold {cold * 1000:.0f}ms, after prewarm {warm * 1000:.0f}ms")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="起動時間 (読み込み・初期化) と最初のコマンドの待ち時間を測る")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--login-ms", type=float, default=300.0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
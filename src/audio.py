@@ -1,34 +1,153 @@
 from __future__ import annotations
 
 import asyncio
+import ctypes.util
 import os
 from pathlib import Path
 
 import discord
 
+from metrics import AUDIO_BUCKETS, Metrics
+from tracing import Tracer
+
 
 DEFAULT_ASSETS_DIR = Path(__file__).resolve().parent.parent / "assets"
 DEFAULT_SOUND_FILE = str(DEFAULT_ASSETS_DIR / "ding.mp3")
 
+FRAME_BYTES = discord.opus.Encoder.FRAME_SIZE
+FRAME_SAMPLES = discord.opus.Encoder.SAMPLES_PER_FRAME
+
+
+class MemoryAudioSource(discord.AudioSource):
+    def __init__(self, frames: list[bytes], opus: bool):
+        self._frames = frames
+        self._opus = opus
+        self._index = 0
+
+    def read(self) -> bytes:
+        if self._index >= len(self._frames):
+            return b""
+        frame = self._frames[self._index]
+        self._index += 1
+        return frame
+
+    def is_opus(self) -> bool:
+        return self._opus
+
 
 class AudioPlayer:
-    def __init__(self, sound_file: str = DEFAULT_SOUND_FILE):
+    VOLUMES = (1.0, 1.5)
+    PLAY_TIMEOUT_SECONDS = 5.0
+    # 同じ区切りで鳴らす通知音は開始をずらし、音声送信とフレーム生成が1度に重ならないようにする
+    START_SPACING_SECONDS = 0.02
+    # ずらす幅の上限。これを超える分は上限の時刻にまとめて鳴らし、次のフェーズがずれ込まないようにする
+    MAX_START_DELAY_SECONDS = 0.5
+
+    def __init__(
+        self,
+        sound_file: str = DEFAULT_SOUND_FILE,
+        metrics: Metrics | None = None,
+        tracer: Tracer | None = None,
+    ):
         self.sound_file = sound_file
+        self.tracer = tracer or Tracer()
+        self._play_seconds = (metrics or Metrics()).histogram(
+            "pomo_audio_play_seconds", "Time from play() to the end of the notification sound.", AUDIO_BUCKETS
+        )
+        # volume -> 20ms ごとのフレーム列 (Opus または PCM)
+        self._frames: dict[float, list[bytes]] = {}
+        self._opus = False
+        self._next_start = 0.0
+
+    async def load(self, volumes: tuple[float, ...] = VOLUMES) -> None:
+        if not self.file_exists():
+            return
+        self._opus = self._ensure_opus()
+        # 音量ごとの FFmpeg は並行して起動する
+        results = await asyncio.gather(*(self._decode(volume) for volume in volumes), return_exceptions=True)
+        for volume, pcm in zip(volumes, results):
+            if isinstance(pcm, (OSError, RuntimeError)):
+                print(f"[DEBUG] 通知音のデコードに失敗しました (volume={volume}): {pcm}")
+                continue
+            if isinstance(pcm, BaseException):
+                raise pcm
+            # Opus への変換は起動中の他の初期化と重ねられるよう別スレッドで行う
+            self._frames[volume] = await asyncio.to_thread(self._split_frames, pcm)
+        print(f"[DEBUG] 通知音をキャッシュしました: volumes={sorted(self._frames)} opus={self._opus}")
 
     async def play(self, voice_client: discord.VoiceClient, volume: float = 1.0) -> None:
         if not self.file_exists():
             return
+        await self._wait_turn()
         if voice_client.is_playing():
             voice_client.stop()
-        audio_source = discord.FFmpegPCMAudio(
-            self.sound_file,
-            options=f'-filter:a "volume={volume}"',
-        )
-        voice_client.play(audio_source)
-        for _ in range(50):
-            if not voice_client.is_playing():
-                break
-            await asyncio.sleep(0.1)
+
+        frames = self._frames.get(volume)
+        source = "memory" if frames is not None else "ffmpeg"
+        loop = asyncio.get_running_loop()
+        finished = asyncio.Event()
+        with self._play_seconds.time(source=source):
+            # 再生そのものは音声の長さだけかかるので、スパンは FFmpeg の起動と再生開始までを計る
+            with self.tracer.span("audio.play", source=source, volume=volume):
+                if frames is not None:
+                    audio_source = MemoryAudioSource(frames, self._opus)
+                else:
+                    audio_source = discord.FFmpegPCMAudio(
+                        self.sound_file,
+                        options=f'-filter:a "volume={volume}"',
+                    )
+                voice_client.play(audio_source, after=lambda _: loop.call_soon_threadsafe(finished.set))
+            try:
+                await asyncio.wait_for(finished.wait(), self.PLAY_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                pass
 
     def file_exists(self) -> bool:
         return os.path.exists(self.sound_file)
+
+    async def _wait_turn(self) -> None:
+        now = asyncio.get_running_loop().time()
+        start = min(max(now, self._next_start), now + self.MAX_START_DELAY_SECONDS)
+        self._next_start = start + self.START_SPACING_SECONDS
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def _ensure_opus(self) -> bool:
+        if discord.opus.is_loaded():
+            return True
+        name = ctypes.util.find_library("opus")
+        if name is None:
+            return False
+        try:
+            discord.opus.load_opus(name)
+        except OSError:
+            return False
+        return discord.opus.is_loaded()
+
+    async def _decode(self, volume: float) -> bytes:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-loglevel", "error",
+            "-i", self.sound_file,
+            "-filter:a", f"volume={volume}",
+            "-f", "s16le",
+            "-ar", "48000",
+            "-ac", "2",
+            "pipe:1",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(stderr.decode(errors="replace").strip())
+        return stdout
+
+    def _split_frames(self, pcm: bytes) -> list[bytes]:
+        frames = []
+        encoder = discord.opus.Encoder() if self._opus else None
+        for offset in range(0, len(pcm), FRAME_BYTES):
+            frame = pcm[offset:offset + FRAME_BYTES]
+            if len(frame) < FRAME_BYTES:
+                frame = frame.ljust(FRAME_BYTES, b"\0")
+            frames.append(encoder.encode(frame, FRAME_SAMPLES) if encoder else frame)
+        return frames
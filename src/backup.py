@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import sqlite3
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import IO, Iterator
+
+from storage import ADD_EVENT_SQL, ADD_ROLLUP_SQLS, ADD_STATS_SQL, DEFAULT_DB_FILE, ROLLUPS, SCHEMA_SQLS
+
+
+FORMAT_VERSION = 1
+# テーブル名 -> 列。並びは storage の加算SQLの引数順に合わせる
+EXPORT_TABLES: dict[str, tuple[str, ...]] = {
+    "stats": ("user_id", "total_minutes", "sessions"),
+    "work_events": ("user_id", "guild_id", "minute", "minutes", "sessions"),
+    **{table: ("user_id", column, "guild_id", "minutes", "sessions") for table, column in ROLLUPS.values()},
+}
+UPSERT_SQLS = {
+    "stats": ADD_STATS_SQL,
+    "work_events": ADD_EVENT_SQL,
+    **{table: ADD_ROLLUP_SQLS[window] for window, (table, _) in ROLLUPS.items()},
+}
+FORMATS = {"jsonl": ".jsonl.gz", "csv": ".zip"}
+MODES = ("replace", "add")
+# 1回に読み書きする行数。全件を持たないので行数が増えてもメモリは増えない
+CHUNK_ROWS = 5000
+
+
+def format_of(path: str | Path) -> str:
+    name = Path(path).name
+    if name.endswith(".zip"):
+        return "csv"
+    if name.endswith((".jsonl", ".jsonl.gz")):
+        return "jsonl"
+    raise ValueError(f"形式が分かりません (.jsonl / .jsonl.gz / .zip): {name}")
+
+
+def snapshot_db(db_file: str | Path, dest: str | Path) -> None:
+    # バックアップAPIを1ステップで実行する。WAL なので読み取り中も Bot の書き込みは止まらず、
+    # 途中の書き込みに影響されない一貫した写しになる
+    source = sqlite3.connect(db_file)
+    target = sqlite3.connect(dest)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def export_db(db_file: str | Path, out_path: str | Path, fmt: str | None = None) -> dict[str, int]:
+    fmt = fmt or format_of(out_path)
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = Path(tmp) / "snapshot.db"
+        snapshot_db(db_file, snapshot)
+        conn = sqlite3.connect(snapshot)
+        try:
+            for sql in SCHEMA_SQLS:
+                conn.execute(sql)
+            if fmt == "jsonl":
+                return _write_jsonl(conn, out_path)
+            return _write_csv_zip(conn, out_path)
+        finally:
+            conn.close()
+
+
+def _chunks(conn: sqlite3.Connection, table: str) -> Iterator[list[tuple]]:
+    cursor = conn.execute(f"SELECT {', '.join(EXPORT_TABLES[table])} FROM {table}")
+    while rows := cursor.fetchmany(CHUNK_ROWS):
+        yield rows
+
+
+def _write_jsonl(conn: sqlite3.Connection, out_path: Path) -> dict[str, int]:
+    counts = dict.fromkeys(EXPORT_TABLES, 0)
+    opener = gzip.open if out_path.name.endswith(".gz") else open
+    with opener(out_path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"pomo_export": FORMAT_VERSION, "tables": EXPORT_TABLES}) + "\n")
+        for table in EXPORT_TABLES:
+            for rows in _chunks(conn, table):
+                f.writelines(json.dumps({"table": table, "row": row}) + "\n" for row in rows)
+                counts[table] += len(rows)
+    return counts
+
+
+def _write_csv_zip(conn: sqlite3.Connection, out_path: Path) -> dict[str, int]:
+    counts = dict.fromkeys(EXPORT_TABLES, 0)
+    with zipfile.ZipFile(out_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for table, columns in EXPORT_TABLES.items():
+            with io.TextIOWrapper(zf.open(f"{table}.csv", "w"), encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                for rows in _chunks(conn, table):
+                    writer.writerows(rows)
+                    counts[table] += len(rows)
+        zf.writestr("manifest.json", json.dumps({"pomo_export": FORMAT_VERSION, "counts": counts}))
+    return counts
+
+
+def import_db(db_file: str | Path, in_path: str | Path, mode: str = "replace") -> dict[str, int]:
+    # replace: 入っていたテーブルを書き出し時点の内容に置き換える (バックアップからの復元)
+    # add: 既存の値に足す (シャードごとのDBを1つにまとめる移行など)
+    if mode not in MODES:
+        raise ValueError(f"unknown mode: {mode}")
+    fmt = format_of(in_path)
+    counts = dict.fromkeys(EXPORT_TABLES, 0)
+    conn = sqlite3.connect(db_file, timeout=30.0, isolation_level=None)
+    try:
+        for sql in SCHEMA_SQLS:
+            conn.execute(sql)
+        # 途中で失敗しても半端な状態が残らないよう、全テーブルを1つのトランザクションで書く
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if mode == "replace":
+                for table in EXPORT_TABLES:
+                    conn.execute(f"DELETE FROM {table}")
+            reader = _read_jsonl(in_path) if fmt == "jsonl" else _read_csv_zip(in_path)
+            for table, rows in reader:
+                conn.executemany(UPSERT_SQLS[table], rows)
+                counts[table] += len(rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return counts
+
+
+def _column_order(table: str, columns: list[str]) -> list[int]:
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"未知のテーブルです: {table}")
+    expected = EXPORT_TABLES[table]
+    if sorted(columns) != sorted(expected):
+        raise ValueError(f"{table} の列が一致しません: {columns}")
+    return [columns.index(column) for column in expected]
+
+
+def _read_jsonl(in_path: str | Path) -> Iterator[tuple[str, list[tuple]]]:
+    opener = gzip.open if str(in_path).endswith(".gz") else open
+    with opener(in_path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("pomo_export") != FORMAT_VERSION:
+            raise ValueError("pomo のエクスポートファイルではありません。")
+        orders = {table: _column_order(table, columns) for table, columns in header["tables"].items()}
+        table, rows = None, []
+        for line in f:
+            record = json.loads(line)
+            if record["table"] != table or len(rows) >= CHUNK_ROWS:
+                if rows:
+                    yield table, rows
+                table, rows = record["table"], []
+            if table not in orders:
+                raise ValueError(f"未知のテーブルです: {table}")
+            row = record["row"]
+            rows.append(tuple(int(row[i]) for i in orders[table]))
+        if rows:
+            yield table, rows
+
+
+def _read_csv_zip(in_path: str | Path) -> Iterator[tuple[str, list[tuple]]]:
+    with zipfile.ZipFile(in_path) as zf:
+        for name in zf.namelist():
+            if not name.endswith(".csv"):
+                continue
+            table = name[:-len(".csv")]
+            with io.TextIOWrapper(zf.open(name), encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                order = _column_order(table, next(reader, []))
+                rows = []
+                for row in reader:
+                    rows.append(tuple(int(row[i]) for i in order))
+                    if len(rows) >= CHUNK_ROWS:
+                        yield table, rows
+                        rows = []
+                if rows:
+                    yield table, rows
+
+
+def _print_counts(action: str, path: str | Path, counts: dict[str, int], out: IO[str]) -> None:
+    detail = ", ".join(f"{table}={count}" for table, count in counts.items())
+    print(f"{action}: {path} ({sum(counts.values())}行: {detail})", file=out)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="統計DBの書き出し・読み込み (Bot を止めずに書き出せる)")
+    parser.add_argument("--db", default=DEFAULT_DB_FILE, help="対象のDBファイル (既定は assets/pomo.db)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="stats と履歴テーブルを書き出す")
+    export.add_argument("output", help="出力先 (.jsonl / .jsonl.gz / .zip)")
+    export.add_argument("--format", choices=tuple(FORMATS), default=None, help="既定は拡張子から判断")
+    load = sub.add_parser("import", help="書き出したファイルを読み込む")
+    load.add_argument("input", help="export で作ったファイル")
+    load.add_argument("--mode", choices=MODES, default="replace", help="replace=置き換え / add=既存の値に加算")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    try:
+        if args.command == "export":
+            counts = export_db(args.db, args.output, args.format)
+            _print_counts("書き出しました", args.output, counts, sys.stdout)
+        else:
+            counts = import_db(args.db, args.input, args.mode)
+            _print_counts(f"読み込みました ({args.mode})", args.input, counts, sys.stdout)
+    except (ValueError, OSError, sqlite3.Error, zipfile.BadZipFile) as e:
+        sys.exit(f"失敗しました: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from tracing import Tracer
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+    # 描画プロセスはこのモジュールを読み込むので、aiohttp などは実行時に読み込まない
+    from shard import ShardRouter
+
+
+HEATMAP_WEEKS = 53
+HISTORY_DAYS = HEATMAP_WEEKS * 7
+
+
+def render_in_worker(today: int, days: list[int], minutes: list[int]) -> tuple[bytes, dict[str, int]]:
+    # NumPy は描画プロセスの中でだけ読み込む。Bot 本体の起動では読み込まない
+    from heatmap import render_stats
+
+    return render_stats(today, days, minutes)
+
+
+class ChartRenderer:
+    # 画像の生成はCPUを使い切るので、イベントループとは別プロセスで行う
+    MAX_WORKERS = 1
+    CACHE_SIZE = 256
+
+    def __init__(
+        self,
+        router: ShardRouter,
+        workers: int = MAX_WORKERS,
+        cache_size: int = CACHE_SIZE,
+        tracer: Tracer | None = None,
+    ):
+        self.router = router
+        self.workers = max(1, workers)
+        self.cache_size = cache_size
+        self.tracer = tracer or Tracer()
+        self._pool: ProcessPoolExecutor | None = None
+        # 同時に渡すのはプロセス数までにして、残りはイベントループ側で待たせる
+        self._slots = asyncio.Semaphore(self.workers)
+        # user_id -> (集計, PNG, 要約)。分が加算されると集計が変わるので描き直す
+        self._cache: OrderedDict[int, tuple[tuple, bytes, dict[str, int]]] = OrderedDict()
+        self.rendered = 0
+        self.cache_hits = 0
+
+    async def render(self, user_id: int) -> tuple[bytes, dict[str, int]]:
+        today, rows = await self.router.get_daily_minutes(user_id, HISTORY_DAYS)
+        key = (today, tuple(rows))
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] == key:
+            self.cache_hits += 1
+            self._cache.move_to_end(user_id)
+            return cached[1], cached[2]
+
+        days = [day for day, _ in rows]
+        minutes = [m for _, m in rows]
+        async with self._slots:
+            with self.tracer.span("charts.render", days=len(rows)):
+                png, summary = await self._run(render_in_worker, today, days, minutes)
+        self.rendered += 1
+        self._cache[user_id] = (key, png, summary)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return png, summary
+
+    async def prewarm(self) -> None:
+        # 描画プロセスの起動と NumPy の読み込みを先に済ませ、最初の !stats chart で待たせない
+        async with self._slots:
+            await self._run(render_in_worker, 0, [], [])
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, fn, *args):
+        from concurrent.futures.process import BrokenProcessPool
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor(), fn, *args)
+        except BrokenProcessPool:
+            # 描画プロセスが落ちたら作り直して1回だけやり直す
+            print("[DEBUG] グラフ描画プロセスが停止したため作り直します。")
+            self.close()
+            return await loop.run_in_executor(self._executor(), fn, *args)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # fork だと aiosqlite などのスレッドを抱えたまま複製されるので spawn で起動する
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
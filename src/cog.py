@@ -1,16 +1,39 @@
 from __future__ import annotations
 
 import asyncio
+import io
+import tempfile
+from datetime import datetime
+from pathlib import Path
 
 import discord
 from discord.ext import commands
-from discord.ui import Button
 
 from audio import AudioPlayer
+from charts import ChartRenderer
+from outbox import LOW, NORMAL, URGENT, Outbox, partial_message, resolve_channel
+from presence import VoicePresence
+from profiler import SamplingProfiler
 from runner import PomoRunner
+from scheduler import TimerScheduler
 from session import PomoSession, SessionManager
+from shard import ShardRouter, ShardUnavailable
+from snapshot import SessionSnapshot, SessionStore
 from storage import StatsRepository
-from views import JoinView
+from tracing import NOOP_SPAN, Tracer
+from views import JoinButton, JoinView, PomoButton
+from voice import VoicePool
+
+
+WINDOW_LABELS = {"today": "今日の", "week": "今週の", "month": "今月の"}
+WINDOW_ALIASES = {"今日": "today", "今週": "week", "今月": "month", "day": "today"}
+CHART_ALIASES = {"chart", "graph", "グラフ"}
+LEADERBOARD_SIZE = 10
+TIMER_PAGE_SIZE = 20
+# メンション1件は最大約23文字なので、50件でもメッセージ上限 (2000文字) に収まる
+LIST_PAGE_SIZE = 50
+# サーバー外 (DM) で使われたときの添付上限
+DEFAULT_FILESIZE_LIMIT = 10 * 1024 * 1024
 
 
 class PomoCog(commands.Cog):
@@ -20,11 +43,31 @@ class PomoCog(commands.Cog):
         manager: SessionManager,
         stats: StatsRepository,
         audio: AudioPlayer,
+        scheduler: TimerScheduler,
+        presence: VoicePresence,
+        outbox: Outbox,
+        snapshots: SessionStore,
+        voice: VoicePool,
+        tracer: Tracer,
+        profiler: SamplingProfiler,
+        router: ShardRouter,
+        charts: ChartRenderer,
     ):
         self.bot = bot
         self.manager = manager
         self.stats = stats
         self.audio = audio
+        self.scheduler = scheduler
+        self.presence = presence
+        self.outbox = outbox
+        self.snapshots = snapshots
+        self.voice = voice
+        self.tracer = tracer
+        self.profiler = profiler
+        # ユーザー単位の集計は他のシャードプロセスの分も合算する
+        self.router = router
+        self.charts = charts
+        self._resumed = False
 
     async def _resolve_owned_session(self, user_id: int) -> tuple[int, PomoSession] | None:
         session = self.manager.get(user_id)
@@ -40,9 +83,109 @@ class PomoCog(commands.Cog):
             return user_id, session
         return None
 
+    async def _run_session(
+        self,
+        session: PomoSession,
+        voice_client: discord.VoiceClient,
+        ctx: commands.Context | discord.abc.Messageable,
+        author_id: int,
+        resume: SessionSnapshot | None = None,
+    ) -> None:
+        runner = PomoRunner(
+            session,
+            voice_client,
+            ctx,
+            self.stats,
+            self.audio,
+            self.manager,
+            author_id,
+            self.scheduler,
+            self.presence,
+            self.outbox,
+            self.snapshots,
+            self.tracer,
+        )
+        interrupted = False
+        try:
+            await runner.run(resume)
+        except asyncio.CancelledError:
+            # 停止・再起動による中断だけはスナップショットを残して次回起動時に再開する。
+            # 例外で落ちたセッションを残すと、起動のたびに再開しては同じ理由で落ちる
+            interrupted = True
+            raise
+        finally:
+            if not interrupted:
+                self.snapshots.discard(author_id)
+            session.active = False
+            session.stop_requested = False
+            session.paused = False
+            session.timer = None
+            session.wakeup = None
+            session.pomo_msg_id = None
+            session.control_msg_id = None
+            session.join_msg_id = None
+            self.manager.update_index(author_id)
+            # 切断せずに待機接続として残す (次のセッションで再利用、期限切れは VoicePool が切断)
+            await self.voice.release(runner.vc)
+
+    async def _resume_session(self, snapshot: SessionSnapshot) -> None:
+        guild = self.bot.get_guild(snapshot.guild_id)
+        channel = guild.get_channel(snapshot.channel_id) if guild else None
+        voice_channel = guild.get_channel(snapshot.voice_channel_id) if guild else None
+        if channel is None or voice_channel is None or self.manager.get(snapshot.author_id) is not None:
+            self.snapshots.discard(snapshot.author_id)
+            return
+
+        member_ids = {snapshot.session["host_id"], *snapshot.session["targets"]}
+        if not any(m.id in member_ids for m in voice_channel.members):
+            print(f"[DEBUG] 参加者がVCにいないためタイマーを再開しません (author_id={snapshot.author_id})")
+            self.snapshots.discard(snapshot.author_id)
+            return
+
+        try:
+            voice_client = await self.voice.acquire(voice_channel)
+        except Exception as e:
+            print(f"[DEBUG] タイマー再開時のVC接続に失敗しました (author_id={snapshot.author_id}): {e}")
+            self.snapshots.discard(snapshot.author_id)
+            return
+
+        session = self.manager.restore(snapshot.author_id, snapshot.session)
+        print(f"[DEBUG] タイマーを再開します (author_id={snapshot.author_id}, phase={snapshot.phase})")
+        await self._run_session(session, voice_client, channel, snapshot.author_id, snapshot)
+
+    async def _resume_sessions(self) -> None:
+        snapshots = await self.snapshots.load_all()
+        if snapshots:
+            print(f"[DEBUG] 再起動前のタイマーを {len(snapshots)} 件再開します。")
+        results = await asyncio.gather(
+            *(self._resume_session(snapshot) for snapshot in snapshots),
+            return_exceptions=True,
+        )
+        for snapshot, result in zip(snapshots, results):
+            if isinstance(result, Exception):
+                print(f"[DEBUG] タイマーの再開に失敗しました (author_id={snapshot.author_id}): {result}")
+
+    async def cog_load(self):
+        # ボタンは custom_id にセッションを埋め込んだ DynamicItem として一度だけ登録する
+        self.bot.add_dynamic_items(PomoButton, JoinButton)
+
+    async def cog_before_invoke(self, ctx):
+        ctx.trace_span = self.tracer.start(
+            f"cmd.{ctx.command.qualified_name}",
+            guild=ctx.guild.id if ctx.guild else None,
+            user=ctx.author.id,
+        )
+
+    async def cog_after_invoke(self, ctx):
+        getattr(ctx, "trace_span", NOOP_SPAN).finish()
+
     @commands.Cog.listener()
     async def on_ready(self):
         print(f"{self.bot.user} としてログインしました。")
+        # on_ready は再接続のたびに呼ばれるので再開は一度だけ
+        if not self._resumed:
+            self._resumed = True
+            asyncio.create_task(self._resume_sessions())
 
     @commands.command()
     async def pomo(
@@ -57,33 +200,17 @@ class PomoCog(commands.Cog):
             await ctx.send("⚠️ ボイスチャンネルに参加してからコマンドを実行してください。")
             return
 
-        target_channel = ctx.author.voice.channel
-        voice_client = ctx.voice_client
-        if voice_client is None:
-            try:
-                voice_client = await target_channel.connect(reconnect=True)
-            except Exception as e:
-                await ctx.send(f"⚠️ ボイスチャンネルに接続できませんでした: {e}")
-                return
-        else:
-            try:
-                if not voice_client.is_connected():
-                    try:
-                        await voice_client.disconnect(force=True)
-                    except Exception:
-                        pass
-                    voice_client = await target_channel.connect(reconnect=True)
-                elif voice_client.channel != target_channel:
-                    await voice_client.move_to(target_channel)
-            except Exception as e:
-                await ctx.send(f"⚠️ ボイスチャンネル接続の更新に失敗しました: {e}")
-                return
-
         existing = self.manager.get(ctx.author.id)
         if existing is not None and existing.active:
             await ctx.send("⚠️ すでにあなたのタイマーが動作中です。")
             return
 
+        try:
+            voice_client = await self.voice.acquire(ctx.author.voice.channel)
+        except Exception as e:
+            await ctx.send(f"⚠️ ボイスチャンネルに接続できませんでした: {e}")
+            return
+
         if existing is None:
             session = self.manager.create(
                 ctx.author.id,
@@ -104,21 +231,12 @@ class PomoCog(commands.Cog):
             session.stop_requested = False
             self.manager.update_index(ctx.author.id)
 
-        runner = PomoRunner(session, voice_client, ctx, self.stats, self.audio, self.manager, ctx.author.id)
-        try:
-            await runner.run()
-        finally:
-            session.active = False
-            session.stop_requested = False
-            session.pomo_view = None
-            session.pomo_msg = None
-            session.control_msg = None
-            session.join_view = None
-            session.join_msg = None
-            self.manager.update_index(ctx.author.id)
+        # コマンドとしての計測は開始までで区切り、以降は runner.* のスパンで計る
+        getattr(ctx, "trace_span", NOOP_SPAN).finish()
+        await self._run_session(session, voice_client, ctx, ctx.author.id)
 
     @commands.command()
-    async def timer(self, ctx):
+    async def timer(self, ctx, page: int = 1):
         result = self.manager.find_by_user(ctx.author.id)
         if result is None:
             await ctx.send("ℹ️ 稼働中のタイマーはありません。")
@@ -145,33 +263,34 @@ class PomoCog(commands.Cog):
             value=f"完了セッション: {session.session_count}回\n合計作業時間: {total_work}分",
             inline=False,
         )
-        all_ids = session.get_all_member_ids()
+        # Embed のフィールド上限 (1024文字) に収まるようページに分ける
+        member_ids = session.ordered_member_ids()
+        pages = max(1, -(-len(member_ids) // TIMER_PAGE_SIZE))
+        page = min(max(page, 1), pages)
         participant_lines = []
-        for uid in all_ids:
+        for uid in member_ids[(page - 1) * TIMER_PAGE_SIZE:page * TIMER_PAGE_SIZE]:
             minutes = session.session_work.get(uid, 0)
             label = "（ホスト）" if uid == session.host_id else ""
             participant_lines.append(f"<@{uid}>{label}: {minutes}分")
-        embed.add_field(
-            name=f"参加者 ({len(all_ids)}人)",
-            value="\n".join(participant_lines),
-            inline=False,
-        )
+        title = f"参加者 ({len(member_ids)}人)"
+        if pages > 1:
+            title += f" {page}/{pages}ページ"
+        embed.add_field(name=title, value="\n".join(participant_lines), inline=False)
+        if pages > 1 and page < pages:
+            embed.set_footer(text=f"続きは !timer {page + 1} で表示できます。")
         await ctx.send(embed=embed)
 
-        if session.join_view and session.join_msg:
-            for child in session.join_view.children:
-                if isinstance(child, Button):
-                    child.disabled = True
-            try:
-                await session.join_msg.edit(view=session.join_view)
-            except discord.HTTPException:
-                pass
-        join_view = JoinView(session, self.manager, author_id)
-        session.join_view = join_view
-        session.join_msg = await ctx.send(
-            f"🙋 参加パネル (手動更新)\n対象: {session.get_target_line()}",
-            view=join_view,
+        old_panel = partial_message(ctx, session.join_channel_id, session.join_msg_id)
+        if old_panel is not None:
+            self.outbox.edit(old_panel, LOW, view=JoinView(author_id, disabled=True))
+        join_msg = await self.outbox.send(
+            ctx,
+            NORMAL,
+            content=f"🙋 参加パネル (手動更新)\n対象: {session.get_target_line()}",
+            view=JoinView(author_id),
         )
+        session.join_channel_id = ctx.channel.id
+        session.join_msg_id = join_msg.id
 
     @commands.command()
     async def add(self, ctx, user: discord.Member):
@@ -197,7 +316,7 @@ class PomoCog(commands.Cog):
         await ctx.send(f"✅ {ctx.author.mention} のタイマー対象に {user.mention} を追加しました。")
 
     @commands.command(name="list")
-    async def list_targets(self, ctx):
+    async def list_targets(self, ctx, page: int = 1):
         resolved = await self._resolve_owned_session(ctx.author.id)
         if resolved is None:
             session = self.manager.get(ctx.author.id)
@@ -213,8 +332,17 @@ class PomoCog(commands.Cog):
         if not session.targets:
             await ctx.send(f"ℹ️ {ctx.author.mention} の追加対象はありません。")
             return
-        mentions = " ".join([f"<@{user_id}>" for user_id in sorted(session.targets)])
-        await ctx.send(f"📌 <@{session.host_id}> のタイマー対象: {mentions}")
+        target_ids = sorted(session.targets)
+        pages = -(-len(target_ids) // LIST_PAGE_SIZE)
+        page = min(max(page, 1), pages)
+        mentions = " ".join(f"<@{user_id}>" for user_id in target_ids[(page - 1) * LIST_PAGE_SIZE:page * LIST_PAGE_SIZE])
+        content = f"📌 <@{session.host_id}> のタイマー対象"
+        if pages > 1:
+            content += f" ({len(target_ids)}人 {page}/{pages}ページ)"
+        content += f": {mentions}"
+        if page < pages:
+            content += f"\n続きは !list {page + 1} で表示できます。"
+        await ctx.send(content)
 
     @commands.command()
     async def remove(self, ctx, user: discord.Member):
@@ -237,21 +365,98 @@ class PomoCog(commands.Cog):
         await ctx.send(f"✅ {ctx.author.mention} のタイマー対象から {user.mention} を削除しました。")
 
     @commands.command(name="stats")
-    async def stats_cmd(self, ctx):
-        row = await self.stats.get_stats(ctx.author.id)
+    async def stats_cmd(self, ctx, window: str | None = None):
+        if window in CHART_ALIASES:
+            await self._send_stats_chart(ctx)
+            return
+        if window is not None:
+            window = WINDOW_ALIASES.get(window, window)
+            if window not in WINDOW_LABELS:
+                await ctx.send("⚠️ 期間は today / week / month のいずれかを指定してください。")
+                return
+        try:
+            if window is None:
+                row = await self.router.get_stats(ctx.author.id)
+                title = "累計"
+            else:
+                row = await self.router.get_window_stats(ctx.author.id, window)
+                title = WINDOW_LABELS[window]
+        except ShardUnavailable:
+            await ctx.send("⚠️ 一部のシャードが応答しません。しばらくしてから再度お試しください。")
+            return
         if row:
             minutes, sessions = row
             await ctx.send(
                 f"📊 **{ctx.author.display_name} さんの記録**\n"
-                f"累計作業時間: {minutes}分\n"
+                f"{title}作業時間: {minutes}分\n"
                 f"完了セッション: {sessions}回"
             )
+        elif window is None:
+            await ctx.send("まだ記録がありません。!pomo で作業を始めましょう！")
         else:
+            await ctx.send(f"{WINDOW_LABELS[window]}の記録はまだありません。")
+
+    async def _send_stats_chart(self, ctx) -> None:
+        try:
+            png, summary = await self.charts.render(ctx.author.id)
+        except ShardUnavailable:
+            await ctx.send("⚠️ 一部のシャードが応答しません。しばらくしてから再度お試しください。")
+            return
+        if summary["year_minutes"] == 0:
             await ctx.send("まだ記録がありません。!pomo で作業を始めましょう！")
+            return
+        embed = discord.Embed(
+            title=f"📈 {ctx.author.display_name} さんの1年間の記録",
+            description=(
+                f"合計 {summary['year_minutes']}分 / 作業した日 {summary['active_days']}日 / "
+                f"連続 {summary['streak']}日\n"
+                f"今週 {summary['week_minutes']}分 (最高 {summary['best_week_minutes']}分)"
+            ),
+            color=discord.Color.green(),
+        )
+        embed.set_image(url="attachment://stats.png")
+        embed.set_footer(text="上: 日ごとの作業時間 (濃いほど長い) / 下: 直近12週の週ごとの作業時間")
+        await ctx.send(embed=embed, file=discord.File(io.BytesIO(png), filename="stats.png"))
+
+    @commands.command(name="leaderboard", aliases=["lb"])
+    async def leaderboard_cmd(self, ctx, window: str | None = None):
+        if ctx.guild is None:
+            await ctx.send("⚠️ ランキングはサーバー内でのみ表示できます。")
+            return
+        if window is None:
+            window = "all"
+            title = "累計"
+        else:
+            window = WINDOW_ALIASES.get(window, window)
+            if window not in WINDOW_LABELS:
+                await ctx.send("⚠️ 期間は today / week / month のいずれかを指定してください。")
+                return
+            title = WINDOW_LABELS[window]
+
+        rows = await self.stats.get_leaderboard(ctx.guild.id, window, LEADERBOARD_SIZE)
+        if not rows:
+            await ctx.send(f"{title}の記録はまだありません。")
+            return
+
+        lines = []
+        for rank, (user_id, minutes) in enumerate(rows, start=1):
+            member = ctx.guild.get_member(user_id)
+            name = member.display_name if member else f"<@{user_id}>"
+            lines.append(f"{rank}. {name} — {minutes}分")
+        embed = discord.Embed(
+            title=f"🏆 {ctx.guild.name} の{title}作業時間ランキング",
+            description="\n".join(lines),
+            color=discord.Color.gold(),
+        )
+        await ctx.send(embed=embed)
 
     @commands.command()
     async def reset(self, ctx):
-        before = await self.stats.reset_stats(ctx.author.id)
+        try:
+            before = await self.router.reset_stats(ctx.author.id)
+        except ShardUnavailable:
+            await ctx.send("⚠️ 一部のシャードが応答しません。しばらくしてから再度お試しください。")
+            return
         if before is None:
             await ctx.send("ℹ️ リセットする記録がありません。")
             return
@@ -281,20 +486,142 @@ class PomoCog(commands.Cog):
             await ctx.send("ボイスチャンネルに入ってからコマンドを打ってください。")
             return
 
-        vc = await ctx.author.voice.channel.connect()
-        await asyncio.sleep(1.5)
+        if self.voice.busy_elsewhere(ctx.author.voice.channel):
+            await ctx.send("⚠️ 別のボイスチャンネルでタイマーが動作中のため、テスト再生できません。")
+            return
 
-        if self.audio.file_exists():
-            print("[DEBUG] ファイルを検出しました。再生を開始します...")
-            vc.play(discord.FFmpegPCMAudio(self.audio.sound_file))
-            while vc.is_playing():
-                await asyncio.sleep(1)
-            print("[DEBUG] 再生が終了しました。")
-            await asyncio.sleep(1.0)
-            await vc.disconnect()
+        reused = ctx.voice_client is not None and ctx.voice_client.is_connected()
+        vc = await self.voice.acquire(ctx.author.voice.channel)
+        try:
+            if not reused:
+                await asyncio.sleep(1.5)
+
+            if self.audio.file_exists():
+                print("[DEBUG] ファイルを検出しました。再生を開始します...")
+                await self.audio.play(vc)
+                print("[DEBUG] 再生が終了しました。")
+                await asyncio.sleep(1.0)
+            else:
+                await ctx.send("❌ assets/ding.mp3 が見つかりません！")
+        finally:
+            await self.voice.release(vc)
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def profile(self, ctx, action: str = "status", value: str | None = None):
+        if action == "start":
+            if self.profiler.running:
+                await ctx.send("ℹ️ プロファイラは既に動作中です。")
+                return
+            self.profiler.start()
+            await ctx.send("🔬 サンプリングプロファイルを開始しました。`!profile stop` で保存します。")
+        elif action == "stop":
+            if not self.profiler.running:
+                await ctx.send("ℹ️ プロファイラは動作していません。")
+                return
+            path, samples, elapsed = await asyncio.to_thread(self.profiler.stop)
+            await ctx.send(f"🔬 プロファイルを保存しました: `{path}` ({samples}サンプル / {elapsed:.1f}秒)")
+        elif action == "trace":
+            if value in ("off", "0"):
+                self.tracer.enabled = False
+            else:
+                if value is not None:
+                    try:
+                        self.tracer.slow_ms = float(value)
+                    except ValueError:
+                        await ctx.send("⚠️ しきい値はミリ秒の数値か off で指定してください。")
+                        return
+                self.tracer.enabled = True
+            state = f"有効 (しきい値 {self.tracer.slow_ms:g}ms)" if self.tracer.enabled else "無効"
+            await ctx.send(f"🔎 トレースを{state}にしました。")
         else:
-            await ctx.send("❌ assets/ding.mp3 が見つかりません！")
-            await vc.disconnect()
+            profiling = "動作中" if self.profiler.running else "停止中"
+            tracing = f"有効 (しきい値 {self.tracer.slow_ms:g}ms)" if self.tracer.enabled else "無効"
+            hits, misses = self.stats.cache_hits, self.stats.cache_misses
+            hit_rate = f"{hits / (hits + misses) * 100:.1f}%" if hits + misses else "-"
+            await ctx.send(
+                f"🔬 プロファイラ: {profiling} / トレース: {tracing} "
+                f"(計測 {self.tracer.spans} 件, 低速 {self.tracer.slow} 件)\n"
+                f"📈 統計キャッシュ: ヒット {hits} 件 / ミス {misses} 件 (ヒット率 {hit_rate})\n"
+                "使い方: `!profile start|stop` / `!profile trace [ミリ秒|off]`"
+            )
+
+    @profile.error
+    async def profile_error(self, ctx, error):
+        if isinstance(error, commands.NotOwner):
+            await ctx.send("⚠️ このコマンドはBotのオーナーのみ使用できます。")
+            return
+        raise error
+
+    @commands.command(name="export", hidden=True)
+    @commands.is_owner()
+    async def export_stats(self, ctx, fmt: str = "jsonl"):
+        # zipfile などの読み込みが重いので、使うときまで読み込まない
+        from backup import FORMATS, export_db
+
+        if fmt not in FORMATS:
+            await ctx.send("⚠️ 形式は `jsonl` か `csv` で指定してください。")
+            return
+        # 書き込み待ちの差分も含めて書き出す。書き出し中も加算は止めない
+        await self.stats.flush()
+        # 全ユーザーの記録なのでチャンネルには出さず、オーナーのDMにだけ送る。ファイルは送ったら消す
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / f"pomo-{datetime.now():%Y%m%d-%H%M%S}{FORMATS[fmt]}"
+            counts = await asyncio.to_thread(export_db, self.stats.db_file, path, fmt)
+            summary = f"{sum(counts.values())}行 (stats {counts['stats']}行 / 作業ログ {counts['work_events']}行)"
+            if path.stat().st_size > DEFAULT_FILESIZE_LIMIT:
+                await ctx.send(
+                    f"⚠️ ファイルが大きいためDMに添付できません ({summary})。"
+                    "`python src/backup.py export` で書き出してください。"
+                )
+                return
+            try:
+                await ctx.author.send(f"📦 統計を書き出しました: {summary}", file=discord.File(path))
+            except discord.Forbidden:
+                await ctx.send("⚠️ DMを送れませんでした。DMの受信を許可してから実行してください。")
+                return
+        if ctx.guild is not None:
+            await ctx.send("📦 統計を書き出してDMに送りました。")
+
+    @commands.command(name="import", hidden=True)
+    @commands.is_owner()
+    async def import_stats(self, ctx, mode: str = "replace"):
+        from backup import MODES, format_of, import_db
+
+        if mode not in MODES:
+            await ctx.send("⚠️ モードは `replace` (置き換え) か `add` (加算) で指定してください。")
+            return
+        if not ctx.message.attachments:
+            await ctx.send("⚠️ `!export` で作ったファイルを添付してください。")
+            return
+        attachment = ctx.message.attachments[0]
+        try:
+            format_of(attachment.filename)
+        except ValueError:
+            await ctx.send("⚠️ 添付できるのは .jsonl / .jsonl.gz / .zip のファイルです。")
+            return
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / attachment.filename
+            await attachment.save(path)
+            try:
+                # 読み込み中は加算の書き込みを止め、終わったらキャッシュとランキングを読み直す
+                async with self.stats.exclusive():
+                    counts = await asyncio.to_thread(import_db, self.stats.db_file, path, mode)
+            except Exception as e:
+                print(f"[DEBUG] 統計の読み込みに失敗しました: {e!r}")
+                await ctx.send(f"❌ 読み込みに失敗しました。DBは変更されていません。({e})")
+                return
+        label = "置き換え" if mode == "replace" else "加算"
+        await ctx.send(f"📥 統計を読み込みました ({label}): {sum(counts.values())}行")
+
+    @export_stats.error
+    @import_stats.error
+    async def backup_error(self, ctx, error):
+        if isinstance(error, commands.NotOwner):
+            await ctx.send("⚠️ このコマンドはBotのオーナーのみ使用できます。")
+            return
+        raise error
 
     @commands.command(name="help")
     async def help_command(self, ctx):
@@ -313,8 +640,8 @@ class PomoCog(commands.Cog):
             inline=False,
         )
         embed.add_field(
-            name="!timer",
-            value="現在の参加パネルを最新位置に再投稿します。",
+            name="!timer [ページ]",
+            value="タイマー情報を表示し、参加パネルを最新位置に再投稿します。\n参加者が多い場合はページを指定できます。",
             inline=False,
         )
         embed.add_field(
@@ -325,7 +652,17 @@ class PomoCog(commands.Cog):
         )
         embed.add_field(name="!list", value="現在の加算対象ユーザー一覧を表示します。", inline=False)
         embed.add_field(name="!remove @user", value="指定ユーザーを加算対象から削除します。", inline=False)
-        embed.add_field(name="!stats", value="あなたの累計作業時間と完了セッション数を表示します。", inline=False)
+        embed.add_field(
+            name="!stats [today|week|month|chart]",
+            value="あなたの累計作業時間と完了セッション数を表示します。\n期間を指定するとその期間の記録を表示します。\n"
+            "`chart` で1年間の日別ヒートマップと週ごとのグラフを画像で表示します。",
+            inline=False,
+        )
+        embed.add_field(
+            name="!leaderboard [today|week|month]",
+            value="このサーバーの作業時間ランキング (上位10名) を表示します。",
+            inline=False,
+        )
         embed.add_field(name="!reset", value="あなたの統計をリセットします。", inline=False)
         embed.add_field(name="!mute", value="タイマー通知音のミュート切替を行います。", inline=False)
         embed.add_field(name="!test", value="ボイスチャンネルで音声再生テストを行います。", inline=False)
@@ -335,10 +672,9 @@ class PomoCog(commands.Cog):
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
+        self.presence.update(member, before, after)
         if before.channel == after.channel:
             return
-        if before.channel is None:
-            return
         if member.bot:
             return
 
@@ -348,19 +684,31 @@ class PomoCog(commands.Cog):
         author_id, session = result
         if not session.active:
             return
+        session.notify()
+        if before.channel is None:
+            return
 
         if member.id == session.host_id:
             guild_vc = member.guild.voice_client if member.guild else None
-            active_ids = set(session.get_vc_active_ids(guild_vc))
+            active_ids = set(session.get_vc_active_ids(guild_vc, self.presence))
             new_host = session.transfer_host(active_ids=active_ids)
             self.manager.update_index(author_id)
-            if session.control_msg:
+            if session.control_msg_id:
+                channel = resolve_channel(member, session.channel_id)
                 if new_host is None:
                     session.stop_requested = True
+                    session.notify()
                     print(f"[DEBUG] stop_requested=True (voice_state_update) host={member.id}")
-                    await session.control_msg.channel.send("ℹ️ ホストが退出しました。残りメンバーがいないためセッションは自動終了します。")
-                else:
-                    await session.control_msg.channel.send(f"👑 ホストが <@{new_host}> に移行しました。")
+                    if channel is not None:
+                        await self.outbox.send(
+                            channel,
+                            URGENT,
+                            content="ℹ️ ホストが退出しました。残りメンバーがいないためセッションは自動終了します。",
+                        )
+                elif channel is not None:
+                    await self.outbox.send(
+                        channel, URGENT, content=f"👑 ホストが <@{new_host}> に移行しました。"
+                    )
         else:
             if session.remove_member(member.id):
                 self.manager.update_index(author_id)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import struct
+import zlib
+
+import numpy as np
+
+from charts import HEATMAP_WEEKS
+
+
+BAR_WEEKS = 12
+CELL = 11
+GAP = 2
+MARGIN = 8
+BAR_HEIGHT = 80
+
+# 0分 / 1〜29分 / 30〜59分 / 60〜119分 / 120分以上 の5段階
+LEVEL_MINUTES = (1, 30, 60, 120)
+PALETTE = np.array(
+    [(235, 237, 240), (155, 233, 168), (64, 196, 99), (48, 161, 78), (33, 110, 57)],
+    dtype=np.uint8,
+)
+BACKGROUND = np.array((255, 255, 255), dtype=np.uint8)
+AXIS = np.array((208, 215, 222), dtype=np.uint8)
+BAR_COLOR = PALETTE[2]
+BAR_CURRENT = PALETTE[4]
+
+
+def daily_grid(today: int, days: np.ndarray, minutes: np.ndarray) -> np.ndarray:
+    # 行=曜日 (月曜始まり)、列=週。右端の列が今週で、まだ来ていない日は -1
+    weekday = (today + 3) % 7
+    first = today - weekday - (HEATMAP_WEEKS - 1) * 7
+    flat = np.zeros(HEATMAP_WEEKS * 7, dtype=np.int64)
+    index = days - first
+    keep = (index >= 0) & (index < flat.size)
+    np.add.at(flat, index[keep], minutes[keep])
+    flat[today - first + 1:] = -1
+    return flat.reshape(HEATMAP_WEEKS, 7).T
+
+
+def summarize(grid: np.ndarray) -> dict[str, int]:
+    flat = grid.T.ravel()
+    flat = flat[flat >= 0]
+    # 今日まだ作業していなくても、昨日まで続いていれば連続日数に数える
+    tail = flat[:-1] if flat.size and flat[-1] == 0 else flat
+    zeros = np.flatnonzero(tail[::-1] == 0)
+    weekly = grid.clip(min=0).sum(axis=0)
+    return {
+        "year_minutes": int(flat.sum()),
+        "active_days": int((flat > 0).sum()),
+        "streak": int(zeros[0]) if zeros.size else int(tail.size),
+        "week_minutes": int(weekly[-1]),
+        "best_week_minutes": int(weekly.max()),
+    }
+
+
+def _cells(colors: np.ndarray) -> np.ndarray:
+    pitch = CELL + GAP
+    image = np.repeat(np.repeat(colors, pitch, axis=0), pitch, axis=1)
+    image[np.arange(image.shape[0]) % pitch >= CELL, :] = BACKGROUND
+    image[:, np.arange(image.shape[1]) % pitch >= CELL] = BACKGROUND
+    return image[:-GAP, :-GAP]
+
+
+def heatmap_image(grid: np.ndarray) -> np.ndarray:
+    colors = PALETTE[np.digitize(grid, LEVEL_MINUTES)]
+    colors[grid < 0] = BACKGROUND
+    return _cells(colors)
+
+
+def weekly_bars_image(weekly: np.ndarray, width: int) -> np.ndarray:
+    pitch = width // len(weekly)
+    peak = max(int(weekly.max()), 1)
+    # 少しでも作業した週は1px以上の棒にする
+    heights = np.where(weekly > 0, np.maximum(weekly * (BAR_HEIGHT - 1) // peak, 1), 0)
+
+    ys = np.arange(BAR_HEIGHT)[:, None]
+    xs = np.arange(width)[None, :]
+    bar = np.minimum(xs // pitch, len(weekly) - 1)
+    inside = (xs % pitch < pitch - GAP * 2) & (xs < pitch * len(weekly))
+    filled = inside & (ys < BAR_HEIGHT - 1) & (ys >= BAR_HEIGHT - 1 - heights[bar])
+
+    image = np.empty((BAR_HEIGHT, width, 3), dtype=np.uint8)
+    image[:] = BACKGROUND
+    image[filled] = BAR_COLOR
+    image[filled & (bar == len(weekly) - 1)] = BAR_CURRENT
+    image[-1, :] = AXIS
+    return image
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    # 8bit RGB・フィルタなしの最小限のPNG。zlib だけで書けるので画像ライブラリやフォントに依存しない
+    height, width, _ = image.shape
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def render_stats(today: int, days: list[int], minutes: list[int]) -> tuple[bytes, dict[str, int]]:
+    # 描画プロセスで実行する。受け渡しは日番号と分数のリストだけにしてpickleを軽くする
+    grid = daily_grid(today, np.asarray(days, dtype=np.int64), np.asarray(minutes, dtype=np.int64))
+    heatmap = heatmap_image(grid)
+    bars = weekly_bars_image(grid.clip(min=0).sum(axis=0)[-BAR_WEEKS:], heatmap.shape[1])
+
+    width = heatmap.shape[1] + MARGIN * 2
+    height = heatmap.shape[0] + bars.shape[0] + MARGIN * 4
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = BACKGROUND
+    image[MARGIN:MARGIN + heatmap.shape[0], MARGIN:-MARGIN] = heatmap
+    image[-MARGIN - bars.shape[0]:-MARGIN, MARGIN:-MARGIN] = bars
+    return encode_png(image), summarize(grid)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import bisect
+
+
+class TopK:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._scores: dict[int, int] = {}
+        # (-score, user_id) の昇順 = スコア降順
+        self._order: list[tuple[int, int]] = []
+        # 容量からあふれたユーザーがいなければ True (全員を保持している)
+        self.complete = True
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._scores
+
+    def update(self, user_id: int, score: int) -> None:
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            del self._order[bisect.bisect_left(self._order, (-old, user_id))]
+        elif len(self._order) >= self.capacity and (-score, user_id) >= self._order[-1]:
+            self.complete = False
+            return
+        if score <= 0:
+            return
+        bisect.insort(self._order, (-score, user_id))
+        self._scores[user_id] = score
+        if len(self._order) > self.capacity:
+            _, dropped = self._order.pop()
+            del self._scores[dropped]
+            self.complete = False
+
+    def add(self, user_id: int, delta: int) -> None:
+        old = self._scores.get(user_id)
+        if old is not None:
+            self.update(user_id, old + delta)
+        elif self.complete:
+            # 全員を保持している盤面にいなければ、これまでの分は0
+            self.update(user_id, delta)
+        # それ以外は圏外の合計がわからないので、書き込み後の読み戻しで反映する
+
+    def discard(self, user_id: int) -> bool:
+        old = self._scores.pop(user_id, None)
+        if old is None:
+            return False
+        del self._order[bisect.bisect_left(self._order, (-old, user_id))]
+        return True
+
+    def top(self, n: int) -> list[tuple[int, int]]:
+        return [(user_id, -neg) for neg, user_id in self._order[:n]]
+
+
+class Leaderboard:
+    CAPACITY = 50
+
+    def __init__(self, capacity: int = CAPACITY):
+        self.capacity = capacity
+        # (guild_id, window) -> (period, TopK)。期間が変わったら空の盤面から数え直す
+        self._boards: dict[tuple[int, str], tuple[int, TopK]] = {}
+        self._stale: set[tuple[int, str]] = set()
+
+    def load(self, guild_id: int, window: str, period: int, rows: list[tuple[int, int]]) -> None:
+        board = TopK(self.capacity)
+        for user_id, score in rows:
+            board.update(user_id, score)
+        board.complete = len(rows) < self.capacity
+        self._boards[(guild_id, window)] = (period, board)
+        self._stale.discard((guild_id, window))
+
+    def update(self, guild_id: int, window: str, period: int, user_id: int, score: int) -> None:
+        key = (guild_id, window)
+        current = self._boards.get(key)
+        if current is None or current[0] != period:
+            current = (period, TopK(self.capacity))
+            self._boards[key] = current
+        current[1].update(user_id, score)
+
+    def add(self, guild_id: int, window: str, period: int, user_id: int, delta: int) -> None:
+        # 書き込み待ちの差分をそのまま盤面に足す (DBを待たずに順位へ反映する)
+        key = (guild_id, window)
+        current = self._boards.get(key)
+        if current is None or current[0] != period:
+            current = (period, TopK(self.capacity))
+            self._boards[key] = current
+        current[1].add(user_id, delta)
+
+    def discard_user(self, user_id: int) -> None:
+        for key, (_, board) in self._boards.items():
+            if board.discard(user_id) and not board.complete:
+                # 圏外のユーザーを繰り上げる必要があるので次回参照時にDBから読み直す
+                self._stale.add(key)
+
+    def is_stale(self, guild_id: int, window: str, period: int) -> bool:
+        key = (guild_id, window)
+        current = self._boards.get(key)
+        return key in self._stale and current is not None and current[0] == period
+
+    def top(self, guild_id: int, window: str, period: int, n: int) -> list[tuple[int, int]]:
+        current = self._boards.get((guild_id, window))
+        if current is None or current[0] != period:
+            return []
+        return current[1].top(n)
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator
+
+from aiohttp import web
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+AUDIO_BUCKETS = (0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+# (ラベル, 値) の列。ラベルは (名前, 値) のタプル
+Samples = Iterable[tuple[tuple[tuple[str, str], ...], float]]
+
+
+def _labels(labels: dict[str, Any]) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _labels(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[tuple[str, tuple[tuple[str, str], ...], float]]:
+        for labels, value in self._values.items():
+            yield self.name, labels, value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[_labels(labels)] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        # ラベル -> [バケットごとの件数..., 合計, 件数]
+        self._values: dict[tuple[tuple[str, str], ...], list[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        row = self._values.get(key)
+        if row is None:
+            row = [0.0] * (len(self.buckets) + 2)
+            self._values[key] = row
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            row[index] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[tuple[str, tuple[tuple[str, str], ...], float]]:
+        for labels, row in self._values.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (("le", _format_value(bound)),), cumulative
+            yield f"{self.name}_bucket", labels + (("le", "+Inf"),), row[-1]
+            yield f"{self.name}_sum", labels, row[-2]
+            yield f"{self.name}_count", labels, row[-1]
+
+
+class Metrics:
+    def __init__(self):
+        self._families: dict[str, Counter | Histogram] = {}
+        # スクレイプ時に既存オブジェクトのカウンタを読み取る (name, kind, help, collect)
+        self._collectors: list[tuple[str, str, str, Callable[[], Samples]]] = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._family(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._family(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        family = self._families.get(name)
+        if family is None:
+            family = Histogram(name, help_text, buckets)
+            self._families[name] = family
+        return family
+
+    def collect(self, name: str, kind: str, help_text: str, collect: Callable[[], Samples]) -> None:
+        self._collectors.append((name, kind, help_text, collect))
+
+    def render(self) -> str:
+        lines = []
+        for family in self._families.values():
+            lines.append(f"# HELP {family.name} {family.help_text}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for name, labels, value in family.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, kind, help_text, collect in self._collectors:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                print(f"[DEBUG] メトリクスの収集に失敗しました ({name}): {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _family(self, cls: type, name: str, help_text: str):
+        family = self._families.get(name)
+        if family is None:
+            family = cls(name, help_text)
+            self._families[name] = family
+        return family
+
+
+def register_runtime(metrics: Metrics, manager, scheduler, outbox, voice, stats) -> None:
+    # 既存の各コンポーネントが持っているカウンタをそのまま公開する (計測のための追加処理はしない)
+    def sessions() -> Samples:
+        active = [session for session in manager.sessions() if session.active]
+        yield (("state", "active"),), len(active)
+        yield (("state", "idle"),), len(manager) - len(active)
+
+    def participants() -> Samples:
+        yield (), sum(session.member_count() for session in manager.sessions() if session.active)
+
+    def scheduler_lag() -> Samples:
+        yield (("stat", "last"),), scheduler.last_lag
+        yield (("stat", "mean"),), scheduler.mean_lag
+        yield (("stat", "max"),), scheduler.max_lag
+
+    def discord_requests() -> Samples:
+        yield (("kind", "send"),), outbox.sent
+        yield (("kind", "edit"),), outbox.edited
+
+    def discord_failures() -> Samples:
+        for kind, count in outbox.failures.items():
+            yield (("kind", kind),), count
+
+    def voice_connections() -> Samples:
+        yield (("event", "connect"),), voice.connects
+        yield (("event", "reconnect"),), voice.reconnects
+        yield (("event", "reuse"),), voice.reuses
+        yield (("event", "disconnect"),), voice.reaped
+
+    metrics.collect("pomo_sessions", "gauge", "Pomodoro sessions by state.", sessions)
+    metrics.collect("pomo_participants", "gauge", "Members of active sessions, including hosts.", participants)
+    metrics.collect("pomo_timer_lag_seconds", "gauge", "How late TimerScheduler wakeups fire.", scheduler_lag)
+    metrics.collect("pomo_discord_requests_total", "counter", "Discord messages sent/edited by the outbox.", discord_requests)
+    metrics.collect("pomo_discord_failures_total", "counter", "Outbox sends/edits that failed after retries.", discord_failures)
+    metrics.collect(
+        "pomo_discord_rate_limited_total", "counter", "429 responses retried by the outbox.",
+        lambda: [((), outbox.rate_limited)],
+    )
+    metrics.collect(
+        "pomo_discord_paced_total", "counter", "Non-urgent outbox jobs delayed to stay under the global request rate.",
+        lambda: [((), outbox.paced)],
+    )
+    metrics.collect(
+        "pomo_discord_queue_depth", "gauge", "Outbox jobs waiting for a rate-limit slot.",
+        lambda: [((), outbox.pending())],
+    )
+    metrics.collect(
+        "pomo_stats_cache_hits_total", "counter", "get_stats calls answered from the in-memory cache.",
+        lambda: [((), stats.cache_hits)],
+    )
+    metrics.collect(
+        "pomo_stats_cache_misses_total", "counter", "get_stats calls that read SQLite.",
+        lambda: [((), stats.cache_misses)],
+    )
+    metrics.collect("pomo_voice_connections_total", "counter", "Voice connection lifecycle events.", voice_connections)
+    metrics.collect(
+        "pomo_voice_idle_connections", "gauge", "Voice connections kept alive between sessions.",
+        lambda: [((), voice.idle_count())],
+    )
+
+
+class MetricsServer:
+    # Prometheus のテキスト形式で /metrics を返す。外部公開しない前提で既定はローカルのみ
+    LOOP_PROBE_SECONDS = 0.5
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9108):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner: web.AppRunner | None = None
+        self._probe_task: asyncio.Task | None = None
+        self._loop_lag = metrics.histogram(
+            "pomo_event_loop_lag_seconds", "Extra delay of a periodic asyncio.sleep probe."
+        )
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._probe_task = asyncio.create_task(self._probe_loop())
+        print(f"[DEBUG] メトリクスを http://{self.host}:{self.port}/metrics で公開しています。")
+
+    async def close(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.metrics.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def _probe_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.LOOP_PROBE_SECONDS)
+            self._loop_lag.observe(max(0.0, loop.time() - start - self.LOOP_PROBE_SECONDS))
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Any, Callable
+
+import discord
+
+from tracing import Tracer
+
+
+URGENT = 0
+NORMAL = 1
+LOW = 2
+
+
+def resolve_channel(origin: Any, channel_id: int) -> discord.abc.Messageable | None:
+    # origin は commands.Context / テキストチャンネル / Member など guild を持つもの
+    channel = getattr(origin, "channel", origin)
+    if getattr(channel, "id", None) == channel_id:
+        return channel
+    guild = getattr(origin, "guild", None)
+    return guild.get_channel(channel_id) if guild else None
+
+
+def partial_message(origin: Any, channel_id: int, message_id: int | None) -> discord.PartialMessage | None:
+    if message_id is None:
+        return None
+    channel = resolve_channel(origin, channel_id)
+    if channel is None:
+        return None
+    return channel.get_partial_message(message_id)
+
+
+class _Job:
+    def __init__(self, kind: str, target: Any, priority: int, kwargs: dict[str, Any]):
+        self.kind = kind
+        self.target = target
+        self.priority = priority
+        self.kwargs = kwargs
+        self.seq = 0
+        self.retries = 0
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.future.add_done_callback(_consume_exception)
+
+
+def _consume_exception(fut: asyncio.Future) -> None:
+    # 待たれていないLOW編集の失敗で警告が出ないようにする
+    if not fut.cancelled():
+        fut.exception()
+
+
+def _chain(source: asyncio.Future, target: asyncio.Future) -> None:
+    def copy(fut: asyncio.Future) -> None:
+        if target.done():
+            return
+        if fut.cancelled():
+            target.cancel()
+        elif fut.exception() is not None:
+            target.set_exception(fut.exception())
+        else:
+            target.set_result(fut.result())
+
+    source.add_done_callback(copy)
+
+
+class _ChannelQueue:
+    def __init__(self, rate: int, per: float, clock: Callable[[], float]):
+        self.heap: list[tuple[int, int, _Job]] = []
+        self.edits: dict[int, _Job] = {}
+        self.rate = rate
+        self.per = per
+        self.clock = clock
+        # 直近 rate 件の応答時刻。固定窓で数えると窓の境目で 2*rate 件が続けて出てしまうので、
+        # 最も古い1件から per 秒空ける (どの窓で数えられても上限を超えない)
+        self.done_at: deque[float] = deque(maxlen=rate)
+        self.blocked_until = 0.0
+        self.worker: asyncio.Task | None = None
+
+    def delay(self) -> float:
+        now = self.clock()
+        wait = self.blocked_until - now
+        if len(self.done_at) == self.rate:
+            wait = max(wait, self.done_at[0] + self.per - now)
+        return max(wait, 0.0)
+
+    def consume(self) -> None:
+        # 応答を受け取った時刻で数える。Discord 側が受け付けた時刻より後なので、間隔は必ず広めになる
+        self.done_at.append(self.clock())
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+class Outbox:
+    # Discordのチャンネル単位の送信上限 (5件/5秒) に合わせる
+    CHANNEL_RATE = 5
+    CHANNEL_PER_SECONDS = 5.0
+    # Bot全体の上限 (50件/秒) に合わせて、優先度に関係なくチャンネルをまたいで間隔を空けて送る
+    GLOBAL_RATE = 50
+    MAX_RETRIES = 3
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, tracer: Tracer | None = None):
+        self.clock = clock
+        self.tracer = tracer or Tracer()
+        self._queues: dict[int, _ChannelQueue] = {}
+        self._seq = itertools.count()
+        self._next_slot = 0.0
+        self.sent = 0
+        self.edited = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.failures = {"send": 0, "edit": 0}
+        self.rate_limited = 0
+        self.paced = 0
+
+    async def send(self, channel: discord.abc.Messageable, priority: int = NORMAL, **kwargs) -> discord.Message:
+        job = _Job("send", channel, priority, kwargs)
+        self._push(self._channel_id(channel), job)
+        # レート制限の待ち時間も含めた、呼び出し元から見た送信時間
+        with self.tracer.span("discord.send", priority=priority):
+            return await job.future
+
+    def edit(self, message: discord.Message, priority: int = NORMAL, **kwargs) -> asyncio.Future:
+        queue = self._queue(message.channel.id)
+        pending = queue.edits.get(message.id)
+        if pending is not None and not pending.future.done():
+            self.coalesced += 1
+            pending.kwargs.update(kwargs)
+            if priority < pending.priority:
+                pending.priority = priority
+                self._push(message.channel.id, pending)
+            return pending.future
+
+        job = _Job("edit", message, priority, kwargs)
+        queue.edits[message.id] = job
+        self._push(message.channel.id, job)
+        return job.future
+
+    def pending(self) -> int:
+        return sum(
+            1
+            for queue in self._queues.values()
+            for _, seq, job in queue.heap
+            if seq == job.seq and not job.future.done()
+        )
+
+    def _channel_id(self, channel: discord.abc.Messageable) -> int:
+        inner = getattr(channel, "channel", None)
+        return getattr(inner, "id", None) or getattr(channel, "id", 0)
+
+    def _queue(self, channel_id: int) -> _ChannelQueue:
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = _ChannelQueue(self.CHANNEL_RATE, self.CHANNEL_PER_SECONDS, self.clock)
+            self._queues[channel_id] = queue
+        return queue
+
+    def _push(self, channel_id: int, job: _Job) -> None:
+        queue = self._queue(channel_id)
+        job.seq = next(self._seq)
+        heapq.heappush(queue.heap, (job.priority, job.seq, job))
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.get_running_loop().create_task(self._drain(queue))
+
+    async def _drain(self, queue: _ChannelQueue) -> None:
+        reserved = False
+        while queue.heap:
+            priority, seq, job = queue.heap[0]
+            # 優先度を上げ直した古いエントリは読み飛ばす
+            if seq != job.seq or job.future.done():
+                heapq.heappop(queue.heap)
+                continue
+            if not reserved:
+                # 多数のセッションが同時に区切りを迎えても、送信はならして一度に押し寄せないようにする
+                reserved = True
+                wait = self._reserve_slot()
+                if wait > 0:
+                    self.paced += 1
+                    await asyncio.sleep(wait)
+                    continue
+
+            # チャンネルの窓は送る直前に確かめる (先に窓を開けてから間隔待ちをすると窓がずれる)
+            delay = queue.delay()
+            if delay > 0:
+                # 枠待ちの間に取った送信時刻は使わず、空いてから取り直す
+                reserved = False
+                await asyncio.sleep(delay)
+                continue
+
+            heapq.heappop(queue.heap)
+            reserved = False
+            if job.kind == "edit":
+                queue.edits.pop(job.target.id, None)
+
+            try:
+                result = await self._execute(job)
+            except discord.HTTPException as e:
+                retry_after = self._retry_after(e)
+                if retry_after is not None and job.retries < self.MAX_RETRIES:
+                    self.rate_limited += 1
+                    job.retries += 1
+                    queue.block(retry_after)
+                    self._requeue(queue, job)
+                    continue
+                self._fail(job, e)
+                continue
+            except Exception as e:
+                self._fail(job, e)
+                continue
+            finally:
+                queue.consume()
+            # 送信中に呼び出し元が取り消していれば結果は捨てる (ここで例外にするとチャンネルのワーカーが止まる)
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _reserve_slot(self) -> float:
+        # 待っているワーカーごとに別々の送信時刻を割り当てるので、起きたあとに取り合いにならない
+        now = self.clock()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1.0 / self.GLOBAL_RATE
+        return slot - now
+
+    def _fail(self, job: _Job, error: Exception) -> None:
+        self.failed += 1
+        self.failures[job.kind] += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _requeue(self, queue: _ChannelQueue, job: _Job) -> None:
+        if job.kind == "edit":
+            pending = queue.edits.get(job.target.id)
+            if pending is not None:
+                # 再送待ちの間に届いた新しい編集へ統合し、内容は新しい方を優先する
+                pending.kwargs = {**job.kwargs, **pending.kwargs}
+                _chain(pending.future, job.future)
+                return
+            queue.edits[job.target.id] = job
+        job.seq = next(self._seq)
+        heapq.heappush(queue.heap, (job.priority, job.seq, job))
+
+    async def _execute(self, job: _Job) -> Any:
+        if job.kind == "send":
+            message = await job.target.send(**job.kwargs)
+            self.sent += 1
+            return message
+        await job.target.edit(**job.kwargs)
+        self.edited += 1
+        return job.target
+
+    def _retry_after(self, error: discord.HTTPException) -> float | None:
+        if error.status != 429:
+            return None
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        for key in ("X-RateLimit-Reset-After", "Retry-After"):
+            value = headers.get(key)
+            if value is not None:
+                try:
+                    return float(value)
+                except ValueError:
+                    pass
+        return getattr(error, "retry_after", None) or 1.0
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import discord
+
+
+class VoicePresence:
+    def __init__(self):
+        # channel_id -> VC在席ユーザーID (Bot除く)。タイマーで使ったチャンネルのみ追跡する
+        self._members: dict[int, set[int]] = {}
+
+    def get(self, channel: discord.abc.GuildChannel) -> set[int]:
+        members = self._members.get(channel.id)
+        if members is None:
+            members = self.reconcile(channel)
+        return members
+
+    def reconcile(self, channel: discord.abc.GuildChannel) -> set[int]:
+        voice_states = getattr(channel, "voice_states", None)
+        if isinstance(voice_states, dict) and voice_states:
+            members = set(voice_states.keys())
+        else:
+            members = {m.id for m in channel.members if not m.bot}
+        self._members[channel.id] = members
+        return members
+
+    def update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState) -> None:
+        if member.bot or before.channel == after.channel:
+            return
+        if before.channel is not None:
+            members = self._members.get(before.channel.id)
+            if members is not None:
+                members.discard(member.id)
+        if after.channel is not None:
+            members = self._members.get(after.channel.id)
+            if members is not None:
+                members.add(member.id)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+
+class SamplingProfiler:
+    # 別スレッドから一定間隔でイベントループのスレッドのスタックを覗くだけなので、ループ側には計測コードが入らない
+    INTERVAL_SECONDS = 0.005
+    MAX_DEPTH = 64
+
+    def __init__(self, output_dir: str | Path, interval: float = INTERVAL_SECONDS):
+        self.output_dir = Path(output_dir)
+        self.interval = interval
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._target: int | None = None
+        self._stacks: Counter[str] = Counter()
+        self._started_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            raise RuntimeError("プロファイラは既に動作中です。")
+        self._target = threading.get_ident()
+        self._stacks = Counter()
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._sample_loop, name="pomo-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> tuple[Path, int, float]:
+        if self._thread is None:
+            raise RuntimeError("プロファイラは動作していません。")
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        elapsed = time.monotonic() - self._started_at
+
+        # flamegraph.pl / speedscope で読める folded 形式 ("関数;関数;... 件数")
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path = self.output_dir / f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+        with path.open("w", encoding="utf-8") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path, sum(self._stacks.values()), elapsed
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < self.MAX_DEPTH:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            names.reverse()
+            self._stacks[";".join(names)] += 1
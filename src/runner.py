@@ -1,15 +1,18 @@
 from __future__ import annotations
 
 import asyncio
-import time
 
 import discord
 from discord.ext import commands
-from discord.ui import Button
 
 from audio import AudioPlayer
+from outbox import LOW, URGENT, Outbox, partial_message
+from presence import VoicePresence
+from scheduler import PhaseTimer, TimerScheduler
 from session import PomoSession, SessionManager
+from snapshot import SessionSnapshot, SessionStore
 from storage import StatsRepository
+from tracing import Tracer
 from views import JoinView, PomoView
 
 
@@ -21,11 +24,16 @@ class PomoRunner:
         self,
         session: PomoSession,
         voice_client: discord.VoiceClient,
-        ctx: commands.Context,
+        ctx: commands.Context | discord.abc.Messageable,
         stats: StatsRepository,
         audio: AudioPlayer,
         manager: SessionManager,
         author_id: int,
+        scheduler: TimerScheduler,
+        presence: VoicePresence,
+        outbox: Outbox,
+        snapshots: SessionStore,
+        tracer: Tracer,
     ):
         self.session = session
         self.vc = voice_client
@@ -34,54 +42,85 @@ class PomoRunner:
         self.audio = audio
         self.manager = manager
         self.author_id = author_id
+        self.scheduler = scheduler
+        self.presence = presence
+        self.outbox = outbox
+        self.snapshots = snapshots
+        self.tracer = tracer
         self._no_member_since: float | None = None
         self._vc_down_since: float | None = None
 
-    async def run(self) -> None:
+    async def run(self, resume: SessionSnapshot | None = None) -> None:
         self.session.active = True
         self.session.stop_requested = False
+        self.session.stopped = False
+        # 前回の実行で一時停止したまま終わっていても、新しい実行は動いた状態から始める
+        if resume is None or resume.state != "paused":
+            self.session.paused = False
+        self.session.wakeup = asyncio.Event()
         self.manager.update_index(self.author_id)
-        self.session.control_msg = await self.ctx.send(
-            f"🛑 **<@{self.session.host_id}> のタイマー**\n"
-            "ポモドーロを終了する場合は、ボイスチャンネルから退出してください。"
+        self.session.channel_id = self.channel.id
+        control_msg = await self.outbox.send(
+            self.ctx,
+            content=(
+                f"🛑 **<@{self.session.host_id}> のタイマー**\n"
+                "ポモドーロを終了する場合は、ボイスチャンネルから退出してください。"
+            ),
         )
-        await self._refresh_panels("開始")
+        self.session.control_msg_id = control_msg.id
+        await self._refresh_panels("再開" if resume else "開始")
 
         while not self.session.stop_requested:
+            self.session.wakeup.clear()
+            if self.session.stopped:
+                await self._notify_stopped()
+                return
             if not self._has_members_with_grace():
                 self.session.stop_requested = True
                 break
-            if not self.session.has_active_members(self.vc):
-                await asyncio.sleep(1)
+            # 再開直後はフェーズ側で在席を待つ (待機中は期限を止める)
+            if resume is None and not self.session.has_active_members(self.vc, self.presence):
+                await self._wait(self._next_control_deadline())
                 continue
 
-            self.session.session_count += 1
-            label = f"セッション {self.session.session_count}"
-
-            ok = await self.run_phase(self.session.work_min, label, "🍅")
-            if not ok:
-                return
-
-            active_ids = self.session.get_vc_active_ids(self.vc)
-            await self.stats.add_completed_session(active_ids)
-            if self.session.pomo_msg:
-                is_long_break = (self.session.session_count % self.session.interval == 0)
-                break_time = self.session.long_brk if is_long_break else self.session.short_brk
-                break_type = "長休憩" if is_long_break else "小休憩"
-                await self.session.pomo_msg.edit(
-                    content=(
-                        f"🎉 **<@{self.session.host_id}> のセッション {self.session.session_count} 完了！** "
-                        f"{self.session.work_min}分の作業が終わりました。\n"
-                        f"💤 {break_type} {break_time}分を開始します..."
-                    ),
-                    view=None,
-                )
+            phase_resume, resume = resume, None
+            if phase_resume is None or phase_resume.phase == "work":
+                if phase_resume is None:
+                    self.session.session_count += 1
+                label = f"セッション {self.session.session_count}"
 
-            if not self.session.muted and self.vc.is_connected():
-                if self.audio.file_exists():
-                    await self.audio.play(self.vc, volume=1.0)
-                else:
-                    await self.ctx.send("⚠️ 音声ファイル (assets/ding.mp3) が見つかりませんでした。")
+                if self.session.stopped:
+                    await self._notify_stopped()
+                    return
+                ok = await self.run_phase(self.session.work_min, label, "🍅", phase_resume)
+                if not ok:
+                    return
+                phase_resume = None
+
+                with self.tracer.span("runner.phase_end", phase="work", session=self.session.session_count):
+                    active_ids = self.session.get_vc_active_ids(self.vc, self.presence)
+                    await self.stats.add_completed_session(active_ids, self._guild_id())
+                    if self.session.pomo_msg_id:
+                        is_long_break = (self.session.session_count % self.session.interval == 0)
+                        break_time = self.session.long_brk if is_long_break else self.session.short_brk
+                        break_type = "長休憩" if is_long_break else "小休憩"
+                        # 同じチャンネルの次の送信より先に届くので待たない (待つと送信の間隔調整ぶん休憩の開始が遅れる)
+                        self._edit_later(
+                            self._message(self.session.pomo_msg_id),
+                            content=(
+                                f"🎉 **<@{self.session.host_id}> のセッション {self.session.session_count} 完了！** "
+                                f"{self.session.work_min}分の作業が終わりました。\n"
+                                f"💤 {break_type} {break_time}分を開始します..."
+                            ),
+                            view=None,
+                        )
+
+                # 通知音は鳴り終わるまで待つので phase_end には含めない (起動時間は audio.play で計る)
+                if not self.session.muted and self.vc.is_connected():
+                    if self.audio.file_exists():
+                        await self.audio.play(self.vc, volume=1.0)
+                    else:
+                        await self.outbox.send(self.ctx, content="⚠️ 音声ファイル (assets/ding.mp3) が見つかりませんでした。")
 
             is_long_break = (self.session.session_count % self.session.interval == 0)
             break_time = self.session.long_brk if is_long_break else self.session.short_brk
@@ -89,81 +128,127 @@ class PomoRunner:
             break_emoji = "☕" if is_long_break else "💤"
 
             if break_time > 0:
-                ok = await self.run_phase(break_time, break_type, break_emoji)
+                if self.session.stopped:
+                    await self._notify_stopped()
+                    return
+                ok = await self.run_phase(break_time, break_type, break_emoji, phase_resume)
                 if not ok:
                     return
-                if self.session.pomo_msg:
-                    await self.session.pomo_msg.edit(
-                        content=f"⏰ **<@{self.session.host_id}> の{break_type}終了！** 次のセッションを始めましょう。",
-                        view=None,
-                    )
+                with self.tracer.span("runner.phase_end", phase="break", session=self.session.session_count):
+                    if self.session.pomo_msg_id:
+                        self._edit_later(
+                            self._message(self.session.pomo_msg_id),
+                            content=f"⏰ **<@{self.session.host_id}> の{break_type}終了！** 次のセッションを始めましょう。",
+                            view=None,
+                        )
 
                 if not self.session.muted and self.vc.is_connected() and self.audio.file_exists():
                     await self.audio.play(self.vc, volume=1.5)
 
-            await asyncio.sleep(2)
+            await self.scheduler.sleep(2)
 
-        if self.session.control_msg:
-            await self.session.control_msg.edit(
+        if self.session.control_msg_id:
+            await self.outbox.edit(
+                self._message(self.session.control_msg_id),
                 content=(
                     f"🎉 **<@{self.session.host_id}> のポモドーロ終了！** "
                     f"合計 {self.session.session_count} セッション完了しました。お疲れ様でした！"
                 )
             )
 
-        if self.vc and self.vc.is_connected():
-            await self.vc.disconnect()
-
-    async def run_phase(self, duration_min: int, label: str, emoji: str) -> bool:
+    async def run_phase(
+        self,
+        duration_min: int,
+        label: str,
+        emoji: str,
+        resume: SessionSnapshot | None = None,
+    ) -> bool:
         if duration_min <= 0:
             return True
 
-        view = PomoView(self.session)
-        self.session.pomo_view = view
-        self.session.pomo_msg = await self.ctx.send(
-            self._phase_start_text(duration_min, label, emoji),
-            view=view,
+        # フェーズ本体は待機がほとんどなので、開始処理・分ごとの処理・終了処理だけを計る
+        span = self.tracer.start("runner.phase_start", label=label, resumed=resume is not None)
+        if self.vc and self.vc.channel:
+            self.presence.reconcile(self.vc.channel)
+        done_minutes = 0
+        elapsed = 0.0
+        if resume is not None:
+            done_minutes = resume.done_minutes
+            elapsed = resume.resume_elapsed(self.snapshots.clock())
+        timer = PhaseTimer(duration_min * 60, clock=self.scheduler.now, elapsed_seconds=elapsed)
+        self.session.start_phase(timer)
+        if resume is not None and resume.state == "paused":
+            self.session.pause()
+        if resume is None:
+            content = self._phase_start_text(duration_min, label, emoji)
+        else:
+            content = self._phase_tick_text(max(duration_min - done_minutes, 0), label, emoji)
+        pomo_msg = await self.outbox.send(
+            self.ctx,
+            content=content,
+            view=PomoView(self.author_id, paused=self.session.paused),
         )
+        self.session.pomo_msg_id = pomo_msg.id
         await self._refresh_panels(label)
-
-        remaining_seconds = duration_min * 60
-        while remaining_seconds > 0:
-            state = await self._wait_tick(view)
-            if state == "paused":
-                continue
-            if state == "wait_members":
-                continue
-            if state == "wait_vc":
-                continue
+        span.finish()
+
+        last_state = None
+        while True:
+            state = self._check_state()
+            if state != last_state:
+                last_state = state
+                self._save_snapshot(emoji, timer, done_minutes, state)
             if state == "stopped":
-                if self.session.control_msg:
-                    await self.session.control_msg.edit(content="⏹️ ポモドーロを終了しました。お疲れ様でした！")
-                if self.vc and self.vc.is_connected():
-                    await self.vc.disconnect()
+                await self._notify_stopped()
                 return False
             if state == "no_members":
-                if self.session.pomo_msg:
-                    await self.session.pomo_msg.edit(content="⏹️ ユーザーが退出したため終了しました。", view=None)
-                if self.vc and self.vc.is_connected():
-                    await self.vc.disconnect()
+                if self.session.pomo_msg_id:
+                    await self.outbox.edit(
+                        self._message(self.session.pomo_msg_id), URGENT, content="⏹️ ユーザーが退出したため終了しました。", view=None
+                    )
                 return False
+            if state in ("wait_members", "wait_vc"):
+                timer.hold("members")
+                await self._wait(self._next_control_deadline())
+                continue
+            timer.release("members")
+            if state == "paused":
+                await self._wait(self._next_control_deadline())
+                continue
 
-            remaining_seconds -= 1
-            if emoji == "🍅" and remaining_seconds % 60 == 0:
-                active_ids = self.session.get_vc_active_ids(self.vc)
-                await self.stats.add_work_minutes(active_ids, 1)
-                for uid in active_ids:
-                    self.session.session_work[uid] = self.session.session_work.get(uid, 0) + 1
-
-            if remaining_seconds % 60 == 0 and remaining_seconds != 0:
-                await self.session.pomo_msg.edit(
-                    content=self._phase_tick_text(remaining_seconds // 60, label, emoji),
-                    view=view,
-                )
-
-        return True
+            with self.tracer.span("runner.tick", label=label):
+                crossed = min(timer.elapsed_minutes(), duration_min) - done_minutes
+                if crossed > 0:
+                    done_minutes += crossed
+                    if emoji == "🍅":
+                        active_ids = self.session.get_vc_active_ids(self.vc, self.presence)
+                        await self.stats.add_work_minutes(active_ids, crossed, self._guild_id())
+                        for uid in active_ids:
+                            self.session.session_work[uid] = self.session.session_work.get(uid, 0) + crossed
+                    self._save_snapshot(emoji, timer, done_minutes, state)
+                    if done_minutes < duration_min:
+                        # 残り時間表示は最新の内容だけ届けばよいので待たない。
+                        # ボタンの表示はボタン側の応答で更新されるので components は送らない
+                        self._edit_later(
+                            self._message(self.session.pomo_msg_id),
+                            LOW,
+                            content=self._phase_tick_text(duration_min - done_minutes, label, emoji),
+                        )
+
+            if timer.remaining() <= 0:
+                return True
+
+            await self._wait(min(timer.minute_deadline(done_minutes + 1), timer.deadline))
+
+    async def _notify_stopped(self) -> None:
+        if self.session.control_msg_id:
+            await self.outbox.edit(
+                self._message(self.session.control_msg_id), URGENT, content="⏹️ ポモドーロを終了しました。お疲れ様でした！"
+            )
 
-    async def _wait_tick(self, view: PomoView) -> str:
+    def _check_state(self) -> str:
+        # 状態を読む前にクリアし、読んだ後の変更は次の待機で拾う
+        self.session.wakeup.clear()
         if self.session.stop_requested:
             return "no_members"
 
@@ -174,40 +259,76 @@ class PomoRunner:
                 self.vc = guild_vc
                 self._vc_down_since = None
             else:
-                now = time.monotonic()
+                now = self.scheduler.now()
                 if self._vc_down_since is None:
                     self._vc_down_since = now
                 if now - self._vc_down_since >= self.VC_DOWN_GRACE_SECONDS:
                     print("[DEBUG] VC切断を検知したためタイマーを終了します。")
                     return "no_members"
-                await asyncio.sleep(1)
                 return "wait_vc"
         else:
             self._vc_down_since = None
 
-        if view.stopped:
+        if self.session.stopped:
             return "stopped"
 
         if not self._has_members_with_grace():
             print("[DEBUG] 在席メンバー0人状態が継続したためタイマーを終了します。")
             return "no_members"
-        if not self.session.has_active_members(self.vc):
-            await asyncio.sleep(1)
+        if not self.session.has_active_members(self.vc, self.presence):
             return "wait_members"
 
-        if view.paused:
-            await asyncio.sleep(1)
+        if self.session.paused:
             return "paused"
 
-        await asyncio.sleep(1)
         return "tick"
 
+    def _save_snapshot(self, emoji: str, timer: PhaseTimer, done_minutes: int, state: str) -> None:
+        # フェーズ開始・状態変化・分の境目でのみ呼ばれる。書き込みは SessionStore がまとめて行う
+        self.snapshots.save(SessionSnapshot(
+            author_id=self.author_id,
+            guild_id=self._guild_id(),
+            channel_id=self.channel.id,
+            voice_channel_id=self.vc.channel.id if self.vc and self.vc.channel else 0,
+            session=self.session.to_snapshot(),
+            phase="work" if emoji == "🍅" else "break",
+            elapsed=timer.elapsed(),
+            done_minutes=done_minutes,
+            state=state,
+            saved_at=self.snapshots.clock(),
+        ))
+
+    @property
+    def channel(self) -> discord.abc.Messageable:
+        return getattr(self.ctx, "channel", self.ctx)
+
+    def _message(self, message_id: int) -> discord.PartialMessage:
+        return self.channel.get_partial_message(message_id)
+
+    def _edit_later(self, message: discord.PartialMessage, *args, **kwargs) -> None:
+        # 待たない編集の失敗はここで受け取ってログに残す
+        self.outbox.edit(message, *args, **kwargs).add_done_callback(_log_edit_failure)
+
+    def _guild_id(self) -> int:
+        return self.ctx.guild.id if self.ctx.guild else 0
+
+    def _next_control_deadline(self) -> float | None:
+        deadlines = []
+        if self._vc_down_since is not None:
+            deadlines.append(self._vc_down_since + self.VC_DOWN_GRACE_SECONDS)
+        if self._no_member_since is not None:
+            deadlines.append(self._no_member_since + self.NO_MEMBER_GRACE_SECONDS)
+        return min(deadlines) if deadlines else None
+
+    async def _wait(self, deadline: float | None) -> None:
+        await self.scheduler.wait(deadline, self.session.wakeup)
+
     def _has_members_with_grace(self) -> bool:
-        if self.session.has_active_members(self.vc):
+        if self.session.has_active_members(self.vc, self.presence):
             self._no_member_since = None
             return True
 
-        now = time.monotonic()
+        now = self.scheduler.now()
         if self._no_member_since is None:
             self._no_member_since = now
             return True
@@ -215,22 +336,18 @@ class PomoRunner:
         return (now - self._no_member_since) < self.NO_MEMBER_GRACE_SECONDS
 
     async def _refresh_panels(self, label: str) -> None:
-        if self.session.join_view and self.session.join_msg:
-            for child in self.session.join_view.children:
-                if isinstance(child, Button):
-                    child.disabled = True
-            try:
-                await self.session.join_msg.edit(view=self.session.join_view)
-            except discord.HTTPException:
-                pass
-
-        join_view = JoinView(self.session, self.manager, self.author_id)
-        join_msg = await self.ctx.send(
-            f"🙋 参加パネル ({label})\n対象: {self.session.get_target_line()}",
-            view=join_view,
-        )
-        self.session.join_view = join_view
-        self.session.join_msg = join_msg
+        with self.tracer.span("runner.refresh_panels", label=label):
+            old_panel = partial_message(self.ctx, self.session.join_channel_id, self.session.join_msg_id)
+            if old_panel is not None:
+                self._edit_later(old_panel, LOW, view=JoinView(self.author_id, disabled=True))
+
+            join_msg = await self.outbox.send(
+                self.ctx,
+                content=f"🙋 参加パネル ({label})\n対象: {self.session.get_target_line()}",
+                view=JoinView(self.author_id),
+            )
+            self.session.join_channel_id = self.channel.id
+            self.session.join_msg_id = join_msg.id
 
     def _phase_start_text(self, duration_min: int, label: str, emoji: str) -> str:
         if emoji == "🍅":
@@ -245,3 +362,9 @@ class PomoRunner:
         if emoji == "🍅":
             return f"🍅 **残り {remaining_min} 分** ({label})\n集中しましょう！"
         return f"{emoji} **<@{self.session.host_id}> の残り {remaining_min} 分** ({label})\nリラックスしましょう！"
+
+
+def _log_edit_failure(fut: asyncio.Future) -> None:
+    if fut.cancelled() or fut.exception() is None:
+        return
+    print(f"[DEBUG] メッセージの編集に失敗しました: {fut.exception()!r}")
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Callable
+
+
+class TimerScheduler:
+    # 同じスロットに入った期限はまとめて1回の起床で処理する
+    SLOT_SECONDS = 0.1
+    LAG_WARN_SECONDS = 1.0
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._heap: list[tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._changed: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+        self._lag_samples = 0
+
+    def now(self) -> float:
+        return self.clock()
+
+    async def sleep_until(self, deadline: float) -> None:
+        if deadline <= self.clock():
+            return
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        entry = (deadline, next(self._seq), fut)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._changed.set()
+        await fut
+
+    async def wait(self, deadline: float | None, wakeup: asyncio.Event) -> None:
+        if wakeup.is_set():
+            return
+        waiter = asyncio.ensure_future(wakeup.wait())
+        if deadline is None:
+            aws = {waiter}
+        else:
+            aws = {waiter, asyncio.ensure_future(self.sleep_until(deadline))}
+        try:
+            await asyncio.wait(aws, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for aw in aws:
+                aw.cancel()
+
+    async def sleep(self, seconds: float) -> None:
+        await self.sleep_until(self.clock() + seconds)
+
+    @property
+    def mean_lag(self) -> float:
+        if self._lag_samples == 0:
+            return 0.0
+        return self._lag_total / self._lag_samples
+
+    def pending(self) -> int:
+        return sum(1 for _, _, fut in self._heap if not fut.done())
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for _, _, fut in self._heap:
+            if not fut.done():
+                fut.cancel()
+        self._heap.clear()
+
+    def _record_lag(self, lag: float) -> None:
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self._lag_total += lag
+        self._lag_samples += 1
+        if lag >= self.LAG_WARN_SECONDS:
+            print(f"[DEBUG] イベントループの遅延を検知しました: {lag:.3f}秒")
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._changed = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._drive())
+
+    async def _drive(self) -> None:
+        while True:
+            while self._heap and self._heap[0][2].done():
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+
+            deadline = self._heap[0][0]
+            # 割り算と掛け算の丸めで枠の終わりが期限よりわずかに手前になることがある。
+            # そのままだと期限前に起きて何も起こさず、待たずに回り続ける
+            slot_end = max(deadline, math.ceil(deadline / self.SLOT_SECONDS) * self.SLOT_SECONDS)
+            timeout = slot_end - self.clock()
+            if timeout > 0:
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+
+            now = self.clock()
+            self._record_lag(max(0.0, now - slot_end))
+            # タイマーが丸め誤差ぶん早く起きても、待っていた枠の分はまとめて起こす
+            due = max(now, slot_end)
+            while self._heap and self._heap[0][0] <= due:
+                _, _, fut = heapq.heappop(self._heap)
+                if not fut.done():
+                    fut.set_result(None)
+
+
+class PhaseTimer:
+    EPSILON_SECONDS = 1e-6
+
+    def __init__(
+        self,
+        total_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+        elapsed_seconds: float = 0.0,
+    ):
+        self.clock = clock
+        self.total_seconds = total_seconds
+        # 再開時は経過済みの時間ぶん期限を前に寄せる
+        self.deadline = clock() + total_seconds - min(elapsed_seconds, total_seconds)
+        self._holds: set[str] = set()
+        self._held_since: float | None = None
+
+    @property
+    def held(self) -> bool:
+        return bool(self._holds)
+
+    def hold(self, reason: str) -> None:
+        if not self._holds:
+            self._held_since = self.clock()
+        self._holds.add(reason)
+
+    def release(self, reason: str) -> None:
+        if reason not in self._holds:
+            return
+        self._holds.discard(reason)
+        if not self._holds and self._held_since is not None:
+            # 停止していた時間ぶんだけ期限を後ろにずらす
+            self.deadline += self.clock() - self._held_since
+            self._held_since = None
+
+    def remaining(self) -> float:
+        now = self._held_since if self._held_since is not None else self.clock()
+        remaining = self.deadline - now
+        # 期限ちょうどに起きたのに誤差で残りがわずかに出ると、過ぎた期限を待ち直して空回りする
+        return remaining if remaining > self.EPSILON_SECONDS else 0.0
+
+    def elapsed(self) -> float:
+        return self.total_seconds - self.remaining()
+
+    def elapsed_minutes(self) -> int:
+        # minute_deadline() ちょうどに起きても1分手前と判定しないようにする
+        return int((self.elapsed() + self.EPSILON_SECONDS) // 60)
+
+    def minute_deadline(self, minutes: int) -> float:
+        return self.deadline - self.total_seconds + minutes * 60
@@ -1,15 +1,25 @@
 from __future__ import annotations
 
+import asyncio
+import time
 from dataclasses import dataclass, field
+from typing import Callable, ClassVar, Iterable
 
 import discord
 
+from presence import VoicePresence
+from scheduler import PhaseTimer
 
-@dataclass
+
+@dataclass(slots=True)
 class PomoSession:
+    # これを超える人数ではメンションを並べず人数表示にする (大部屋モード)
+    LARGE_ROOM_MEMBERS: ClassVar[int] = 20
+
     # ユーザー情報
     host_id: int
     targets: set[int] = field(default_factory=set)
+    # 参加順。退出したユーザーは取り除くので host と targets の人数を超えない
     join_order: list[int] = field(default_factory=list)
     # セッション設定
     work_min: int = 25
@@ -22,20 +32,99 @@ class PomoSession:
     muted: bool = False
     active: bool = False
     stop_requested: bool = False
-    # UI関連
-    pomo_view: "PomoView | None" = field(default=None, repr=False)
-    pomo_msg: "discord.Message | None" = field(default=None, repr=False)
-    control_msg: "discord.Message | None" = field(default=None, repr=False)
-    join_view: "JoinView | None" = field(default=None, repr=False)
-    join_msg: "discord.Message | None" = field(default=None, repr=False)
+    created_at: float = 0.0
+    # Event は1つで約1KBあるので、実行中のみ PomoRunner が用意する
+    wakeup: asyncio.Event | None = field(default=None, repr=False)
+    # 実行中フェーズの状態 (フェーズ開始時に初期化)
+    timer: "PhaseTimer | None" = field(default=None, repr=False)
+    paused: bool = False
+    stopped: bool = False
+    # UI関連。Message オブジェクトは保持せず ID だけを持つ
+    channel_id: int = 0
+    pomo_msg_id: int | None = None
+    control_msg_id: int | None = None
+    join_channel_id: int = 0
+    join_msg_id: int | None = None
+
+    def notify(self) -> None:
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def start_phase(self, timer: PhaseTimer) -> None:
+        # フェーズの合間に押された ⏹️ / ⏸️ を取りこぼさないよう、状態は引き継ぐ
+        self.timer = timer
+        if self.paused:
+            timer.hold("pause")
+
+    def pause(self) -> None:
+        self.paused = True
+        if self.timer:
+            self.timer.hold("pause")
+        self.notify()
+
+    def resume(self) -> None:
+        self.paused = False
+        if self.timer:
+            self.timer.release("pause")
+        self.notify()
+
+    def request_stop(self) -> None:
+        self.stopped = True
+        self.notify()
+
+    def to_snapshot(self) -> dict:
+        return {
+            "host_id": self.host_id,
+            "targets": sorted(self.targets),
+            "join_order": list(self.join_order),
+            "work_min": self.work_min,
+            "short_brk": self.short_brk,
+            "long_brk": self.long_brk,
+            "interval": self.interval,
+            "session_count": self.session_count,
+            # JSON のキーは文字列になる
+            "session_work": {str(uid): minutes for uid, minutes in self.session_work.items()},
+            "muted": self.muted,
+        }
 
     def get_all_member_ids(self) -> set[int]:
-        return {self.host_id} | set(self.targets)
+        return self.targets | {self.host_id}
+
+    def is_member(self, user_id: int) -> bool:
+        return user_id == self.host_id or user_id in self.targets
+
+    def member_count(self) -> int:
+        return len(self.targets) + (0 if self.host_id in self.targets else 1)
+
+    @property
+    def large_room(self) -> bool:
+        return self.member_count() > self.LARGE_ROOM_MEMBERS
 
-    def get_vc_active_ids(self, voice_client: discord.VoiceClient | None) -> list[int]:
+    def ordered_member_ids(self) -> list[int]:
+        # ホスト → 参加順 → join_order に無い対象 (ID順)
+        ordered = [self.host_id]
+        listed = {self.host_id}
+        for uid in self.join_order:
+            if uid in self.targets and uid not in listed:
+                ordered.append(uid)
+                listed.add(uid)
+        ordered.extend(sorted(self.targets - listed))
+        return ordered
+
+    def get_vc_active_ids(
+        self,
+        voice_client: discord.VoiceClient | None,
+        presence: VoicePresence | None = None,
+    ) -> list[int]:
         if not voice_client or not voice_client.channel:
             return []
 
+        present = presence.get(voice_client.channel) if presence else None
+        if present:
+            active_ids = [self.host_id] if self.host_id in present else []
+            active_ids.extend(self.targets & present)
+            return active_ids
+
         voice_states = getattr(voice_client.channel, "voice_states", None)
         if isinstance(voice_states, dict):
             vc_member_ids = set(voice_states.keys())
@@ -59,7 +148,15 @@ class PomoSession:
         active_ids = vc_member_ids & self.get_all_member_ids()
         return list(active_ids)
 
-    def has_active_members(self, voice_client: discord.VoiceClient | None) -> bool:
+    def has_active_members(
+        self,
+        voice_client: discord.VoiceClient | None,
+        presence: VoicePresence | None = None,
+    ) -> bool:
+        if presence and voice_client and voice_client.channel:
+            present = presence.get(voice_client.channel)
+            if present:
+                return self.host_id in present or not self.targets.isdisjoint(present)
         return len(self.get_vc_active_ids(voice_client)) > 0
 
     def transfer_host(self, active_ids: set[int] | None = None) -> int | None:
@@ -69,6 +166,8 @@ class PomoSession:
             if active_ids is not None and user_id not in active_ids:
                 continue
             self.targets.remove(user_id)
+            if self.host_id in self.join_order:
+                self.join_order.remove(self.host_id)
             self.host_id = user_id
             return user_id
         return None
@@ -77,46 +176,95 @@ class PomoSession:
         if user_id == self.host_id or user_id in self.targets:
             return False
         self.targets.add(user_id)
-        if user_id not in self.join_order:
-            self.join_order.append(user_id)
+        # 退出時に取り除いているので、新しく対象になったユーザーは join_order に居ない
+        self.join_order.append(user_id)
+        self.notify()
         return True
 
     def remove_member(self, user_id: int) -> bool:
         if user_id in self.targets:
             self.targets.remove(user_id)
+            if user_id in self.join_order:
+                self.join_order.remove(user_id)
+            self.notify()
             return True
         return False
 
     def get_target_line(self) -> str:
-        mentions = [f"<@{self.host_id}>"]
-        ordered_targets = [uid for uid in self.join_order if uid in self.targets]
-        mentions.extend([f"<@{uid}>" for uid in ordered_targets])
-        for uid in sorted(self.targets):
-            if uid not in ordered_targets:
-                mentions.append(f"<@{uid}>")
-        return " ".join(mentions)
+        if self.large_room:
+            return f"<@{self.host_id}> ほか {self.member_count() - 1}人"
+        return " ".join(f"<@{uid}>" for uid in self.ordered_member_ids())
 
 
 class SessionManager:
-    def __init__(self):
+    # !add だけされて一度も開始されないセッションを破棄するまでの時間
+    IDLE_TTL_SECONDS = 6 * 3600
+    EVICT_INTERVAL_SECONDS = 600
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._last_evict = clock()
         self._sessions: dict[int, PomoSession] = {}
+        # user_id -> author_id と author_id -> user_id集合 の双方向インデックス
         self._user_index: dict[int, int] = {}
+        self._owner_index: dict[int, set[int]] = {}
 
     def create(self, author_id: int, **kwargs) -> PomoSession:
-        session = PomoSession(host_id=author_id, **kwargs)
+        now = self.clock()
+        if now - self._last_evict >= self.EVICT_INTERVAL_SECONDS:
+            self.evict_idle(now)
+        session = PomoSession(host_id=author_id, created_at=now, **kwargs)
         session.join_order.append(author_id)
         self._sessions[author_id] = session
         self.update_index(author_id)
         return session
 
+    def evict_idle(self, now: float | None = None) -> int:
+        now = self.clock() if now is None else now
+        self._last_evict = now
+        expired = [
+            author_id
+            for author_id, session in self._sessions.items()
+            if not session.active and session.session_count == 0 and now - session.created_at >= self.IDLE_TTL_SECONDS
+        ]
+        for author_id in expired:
+            self.remove(author_id)
+        if expired:
+            print(f"[DEBUG] 未開始のセッションを {len(expired)} 件破棄しました。")
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def sessions(self) -> Iterable[PomoSession]:
+        return self._sessions.values()
+
+    def restore(self, author_id: int, fields: dict) -> PomoSession:
+        session = PomoSession(
+            host_id=fields["host_id"],
+            targets=set(fields["targets"]),
+            join_order=list(fields["join_order"]),
+            work_min=fields["work_min"],
+            short_brk=fields["short_brk"],
+            long_brk=fields["long_brk"],
+            interval=fields["interval"],
+            session_count=fields["session_count"],
+            session_work={int(uid): minutes for uid, minutes in fields["session_work"].items()},
+            muted=fields["muted"],
+            created_at=self.clock(),
+        )
+        self._sessions[author_id] = session
+        self.update_index(author_id)
+        return session
+
     def get(self, author_id: int) -> PomoSession | None:
         return self._sessions.get(author_id)
 
     def remove(self, author_id: int) -> None:
         self._sessions.pop(author_id, None)
-        stale_users = [uid for uid, owner in self._user_index.items() if owner == author_id]
-        for uid in stale_users:
-            self._user_index.pop(uid, None)
+        for uid in self._owner_index.pop(author_id, ()):
+            if self._user_index.get(uid) == author_id:
+                del self._user_index[uid]
 
     def find_by_user(self, user_id: int) -> tuple[int, PomoSession] | None:
         author_id = self._user_index.get(user_id)
@@ -130,11 +278,19 @@ class SessionManager:
 
     def update_index(self, author_id: int) -> None:
         session = self._sessions.get(author_id)
-        stale_users = [uid for uid, owner in self._user_index.items() if owner == author_id]
-        for uid in stale_users:
-            self._user_index.pop(uid, None)
         if session is None:
+            self.remove(author_id)
             return
         indexed_ids = session.get_all_member_ids() if session.active else {session.host_id}
-        for uid in indexed_ids:
+        owned = self._owner_index.setdefault(author_id, set())
+
+        for uid in owned - indexed_ids:
+            owned.discard(uid)
+            if self._user_index.get(uid) == author_id:
+                del self._user_index[uid]
+        for uid in indexed_ids - owned:
+            previous = self._user_index.get(uid)
+            if previous is not None and previous != author_id:
+                self._owner_index.get(previous, set()).discard(uid)
             self._user_index[uid] = author_id
+            owned.add(uid)
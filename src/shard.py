@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+import aiohttp
+from aiohttp import web
+
+from storage import StatsRepository
+
+
+def shard_of(guild_id: int, shard_count: int) -> int:
+    # Discord のゲートウェイと同じ割り当て式
+    return (guild_id >> 22) % shard_count
+
+
+class ShardUnavailable(Exception):
+    pass
+
+
+class ShardLayoutMismatch(Exception):
+    pass
+
+
+def _has_rows(db_file: Path) -> bool:
+    if not db_file.exists():
+        return False
+    with closing(sqlite3.connect(db_file)) as db:
+        tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return any(
+            db.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is not None
+            for table in ("stats", "work_events", "session_snapshots")
+            if table in tables
+        )
+
+
+@dataclass
+class ShardLayout:
+    shard_count: int
+    process_count: int
+    process_index: int
+    base_port: int = 9200
+    host: str = "127.0.0.1"
+
+    @classmethod
+    def from_env(cls) -> ShardLayout | None:
+        raw = os.getenv("POMO_PROCESS_COUNT", "").strip()
+        if not raw:
+            return None
+        process_count = int(raw)
+        layout = cls(
+            shard_count=int(os.getenv("POMO_SHARD_COUNT", str(process_count))),
+            process_count=process_count,
+            process_index=int(os.getenv("POMO_PROCESS_INDEX", "0")),
+            base_port=int(os.getenv("POMO_PEER_BASE_PORT", str(cls.base_port))),
+        )
+        if not 0 <= layout.process_index < layout.process_count <= layout.shard_count:
+            raise ValueError(
+                f"シャード設定が不正です: shards={layout.shard_count} "
+                f"processes={layout.process_count} index={layout.process_index}"
+            )
+        return layout
+
+    def shard_ids_of(self, process_index: int) -> list[int]:
+        # 連続したシャード範囲をプロセスに割り当てる
+        per_process = -(-self.shard_count // self.process_count)
+        start = process_index * per_process
+        return list(range(start, min(start + per_process, self.shard_count)))
+
+    @property
+    def shard_ids(self) -> list[int]:
+        return self.shard_ids_of(self.process_index)
+
+    def owner_of(self, guild_id: int) -> int:
+        per_process = -(-self.shard_count // self.process_count)
+        return shard_of(guild_id, self.shard_count) // per_process
+
+    def port(self, process_index: int) -> int:
+        return self.base_port + process_index
+
+    def peers(self) -> list[int]:
+        return [i for i in range(self.process_count) if i != self.process_index]
+
+    def db_file(self, db_file: str, process_index: int | None = None) -> str:
+        # 書き込みが競合しないようにプロセスごとに別ファイルへ分ける。
+        # 名前は担当シャードで決めるので、構成を変えると別の名前になり取り違えない
+        path = Path(db_file)
+        shard_ids = self.shard_ids_of(self.process_index if process_index is None else process_index)
+        return str(path.with_name(f"{path.stem}.s{shard_ids[0]}-{shard_ids[-1]}of{self.shard_count}{path.suffix}"))
+
+    def prepare_db_files(self, db_file: str) -> None:
+        # 別の構成で作ったファイルが残っていれば起動しない (ギルドの履歴が別ファイルに取り残される)。
+        # 分割前の DB にデータがあれば、最初の起動で各プロセスの担当分に分けて引き継ぐ
+        path = Path(db_file)
+        expected = {Path(self.db_file(db_file, i)) for i in range(self.process_count)}
+        existing = {
+            p for p in path.parent.glob(f"{path.stem}.[ps]*{path.suffix}") if p.name.endswith(path.suffix)
+        }
+        foreign = sorted(p.name for p in existing - expected)
+        if foreign:
+            raise ShardLayoutMismatch(
+                f"前回と異なるシャード構成のDBがあります: {', '.join(foreign)}\n"
+                "前回と同じ --processes / --shards で起動するか、src/backup.py で1つのDBにまとめてから移してください。"
+            )
+        if existing or not _has_rows(path):
+            return
+        for i in range(self.process_count):
+            self._split_db(path, Path(self.db_file(db_file, i)), i)
+        print(f"[DEBUG] {path.name} のデータを {self.process_count} 個のシャード別DBに分けました ({path.name} はそのまま残します)。")
+
+    def _split_db(self, source: Path, target: Path, process_index: int) -> None:
+        per_process = -(-self.shard_count // self.process_count)
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.unlink(missing_ok=True)
+        with closing(sqlite3.connect(source)) as db:
+            db.execute("VACUUM INTO ?", (str(tmp),))
+        with closing(sqlite3.connect(tmp)) as db:
+            tables = [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            for table in tables:
+                columns = {row[1] for row in db.execute(f'PRAGMA table_info("{table}")')}
+                if "guild_id" in columns:
+                    # ギルドに紐づく行は、そのギルドを担当するプロセスだけに残す
+                    db.execute(
+                        f'DELETE FROM "{table}" WHERE ((guild_id >> 22) % ?) / ? != ?',
+                        (self.shard_count, per_process, process_index),
+                    )
+                elif process_index != 0:
+                    # ユーザー単位の累計は ShardRouter が全プロセス分を合算するので、1か所にだけ残す
+                    db.execute(f'DELETE FROM "{table}"')
+            db.commit()
+        tmp.replace(target)
+
+
+class ShardRouter:
+    # ギルドに紐づかないユーザー単位の集計 (!stats / !reset) を全プロセスの StatsRepository に振り分ける
+    TIMEOUT_SECONDS = 2.0
+
+    def __init__(self, layout: ShardLayout | None, stats: StatsRepository):
+        self.layout = layout
+        self.stats = stats
+        self.app = web.Application()
+        self.app.router.add_get("/stats/{user_id}", self._handle_stats)
+        self.app.router.add_post("/reset/{user_id}", self._handle_reset)
+        self.app.router.add_get("/daily/{user_id}", self._handle_daily)
+        self._runner: web.AppRunner | None = None
+        self._client: aiohttp.ClientSession | None = None
+
+    async def start(self) -> None:
+        if self.layout is None:
+            return
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        port = self.layout.port(self.layout.process_index)
+        await web.TCPSite(self._runner, self.layout.host, port).start()
+        self._client = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.TIMEOUT_SECONDS))
+        print(f"[DEBUG] シャード {self.layout.shard_ids} の集計APIを {self.layout.host}:{port} で待ち受けています。")
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def get_stats(self, user_id: int) -> tuple[int, int] | None:
+        local = await self.stats.get_stats(user_id)
+        return _sum_rows([local, *await self._ask_peers("GET", f"/stats/{user_id}")])
+
+    async def get_window_stats(self, user_id: int, window: str) -> tuple[int, int] | None:
+        local = await self.stats.get_window_stats(user_id, window)
+        return _sum_rows([local, *await self._ask_peers("GET", f"/stats/{user_id}?window={window}")])
+
+    async def get_daily_minutes(self, user_id: int, days: int) -> tuple[int, list[tuple[int, int]]]:
+        today, local = await self.stats.get_daily_minutes(user_id, days)
+        remote = await self._ask_peers("GET", f"/daily/{user_id}?days={days}", _parse_days)
+        if not remote:
+            return today, local
+        totals: dict[int, int] = {}
+        for rows in (local, *remote):
+            for day, minutes in rows:
+                totals[day] = totals.get(day, 0) + minutes
+        return today, sorted(totals.items())
+
+    async def reset_stats(self, user_id: int) -> tuple[int, int] | None:
+        # 1つでも応答しないプロセスがあれば自分の分は消さずにエラーにする (再実行で残りも消える)
+        remote = await self._ask_peers("POST", f"/reset/{user_id}")
+        local = await self.stats.reset_stats(user_id)
+        return _sum_rows([local, *remote])
+
+    async def _ask_peers(
+        self, method: str, path: str, parse: Callable[[dict], Any] | None = None
+    ) -> list[Any]:
+        if self.layout is None or not self.layout.peers():
+            return []
+        if self._client is None:
+            raise ShardUnavailable("ShardRouter.start() が呼ばれていません。")
+        results = await asyncio.gather(
+            *(self._ask(method, peer, path, parse or _parse_row) for peer in self.layout.peers()),
+            return_exceptions=True,
+        )
+        failed = [peer for peer, result in zip(self.layout.peers(), results) if isinstance(result, Exception)]
+        if failed:
+            print(f"[DEBUG] シャードプロセス {failed} から応答がありません: {path}")
+            raise ShardUnavailable(f"process {failed} did not respond")
+        return results
+
+    async def _ask(self, method: str, peer: int, path: str, parse: Callable[[dict], Any]) -> Any:
+        url = f"http://{self.layout.host}:{self.layout.port(peer)}{path}"
+        async with self._client.request(method, url) as response:
+            response.raise_for_status()
+            return parse(await response.json())
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        user_id = int(request.match_info["user_id"])
+        window = request.query.get("window")
+        if window is None:
+            row = await self.stats.get_stats(user_id)
+        else:
+            row = await self.stats.get_window_stats(user_id, window)
+        return web.json_response({"row": row})
+
+    async def _handle_reset(self, request: web.Request) -> web.Response:
+        row = await self.stats.reset_stats(int(request.match_info["user_id"]))
+        return web.json_response({"row": row})
+
+    async def _handle_daily(self, request: web.Request) -> web.Response:
+        days = int(request.query.get("days", "0"))
+        _, rows = await self.stats.get_daily_minutes(int(request.match_info["user_id"]), days)
+        return web.json_response({"days": rows})
+
+
+def _parse_row(body: dict) -> tuple[int, int] | None:
+    row = body["row"]
+    return (row[0], row[1]) if row else None
+
+
+def _parse_days(body: dict) -> list[tuple[int, int]]:
+    return [(day, minutes) for day, minutes in body["days"]]
+
+
+def _sum_rows(rows: list[tuple[int, int] | None]) -> tuple[int, int] | None:
+    present = [row for row in rows if row is not None]
+    if not present:
+        return None
+    return sum(row[0] for row in present), sum(row[1] for row in present)
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import aiosqlite
+
+
+UPSERT_SNAPSHOT_SQL = """
+INSERT INTO session_snapshots (author_id, guild_id, channel_id, voice_channel_id, saved_at, state)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(author_id) DO UPDATE SET
+guild_id = excluded.guild_id,
+channel_id = excluded.channel_id,
+voice_channel_id = excluded.voice_channel_id,
+saved_at = excluded.saved_at,
+state = excluded.state
+"""
+DELETE_SNAPSHOT_SQL = "DELETE FROM session_snapshots WHERE author_id = ?"
+LOAD_SNAPSHOTS_SQL = """
+SELECT author_id, guild_id, channel_id, voice_channel_id, saved_at, state FROM session_snapshots
+"""
+# 停止していた間を作業時間として数えるのはこの秒数まで (再起動にかかる時間の目安)。
+# 長時間止まっていた分まで加算すると、Bot が落ちていた時間を作業したことになってしまう
+MAX_RESUME_DOWNTIME_SECONDS = 60.0
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS session_snapshots (
+    author_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    voice_channel_id INTEGER NOT NULL,
+    saved_at REAL NOT NULL,
+    state TEXT NOT NULL
+)
+"""
+
+
+@dataclass
+class SessionSnapshot:
+    author_id: int
+    guild_id: int
+    channel_id: int
+    voice_channel_id: int
+    # PomoSession の永続化対象フィールド
+    session: dict
+    # 実行中フェーズ: "work" / "break"
+    phase: str
+    elapsed: float
+    done_minutes: int
+    # _check_state の結果 ("tick" / "paused" / "wait_members" など)
+    state: str
+    saved_at: float
+
+    def resume_elapsed(self, now: float) -> float:
+        # 計測中だったフェーズは停止していた間も進んでいたものとして扱う (上限あり)
+        if self.state == "tick":
+            return self.elapsed + min(max(0.0, now - self.saved_at), MAX_RESUME_DOWNTIME_SECONDS)
+        return self.elapsed
+
+    def to_row(self) -> tuple:
+        state = {
+            "session": self.session,
+            "phase": self.phase,
+            "elapsed": self.elapsed,
+            "done_minutes": self.done_minutes,
+            "state": self.state,
+        }
+        return (
+            self.author_id,
+            self.guild_id,
+            self.channel_id,
+            self.voice_channel_id,
+            self.saved_at,
+            json.dumps(state, separators=(",", ":")),
+        )
+
+    @classmethod
+    def from_row(cls, row: tuple) -> SessionSnapshot:
+        author_id, guild_id, channel_id, voice_channel_id, saved_at, raw = row
+        state = json.loads(raw)
+        return cls(
+            author_id=author_id,
+            guild_id=guild_id,
+            channel_id=channel_id,
+            voice_channel_id=voice_channel_id,
+            session=state["session"],
+            phase=state["phase"],
+            elapsed=state["elapsed"],
+            done_minutes=state["done_minutes"],
+            state=state["state"],
+            saved_at=saved_at,
+        )
+
+
+class SessionStore:
+    FLUSH_INTERVAL_SECONDS = 5.0
+
+    def __init__(
+        self,
+        db_file: str,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.db_file = db_file
+        self.flush_interval = flush_interval
+        # 再起動をまたぐので壁時計を使う
+        self.clock = clock
+        self._db: aiosqlite.Connection | None = None
+        # author_id -> 保存待ちスナップショット (None は削除)
+        self._dirty: dict[int, SessionSnapshot | None] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self.writes = 0
+
+    async def init(self) -> None:
+        if self._db is None:
+            self._db = await aiosqlite.connect(self.db_file)
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            await self._db.execute("PRAGMA synchronous=NORMAL")
+        await self._db.execute(SCHEMA_SQL)
+        await self._db.commit()
+        if self._flush_task is None and self.flush_interval > 0:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._db is None:
+            return
+        await self.flush()
+        db, self._db = self._db, None
+        await db.close()
+
+    @property
+    def db(self) -> aiosqlite.Connection:
+        if self._db is None:
+            raise RuntimeError("SessionStore.init() が呼ばれていません。")
+        return self._db
+
+    def save(self, snapshot: SessionSnapshot) -> None:
+        # 同じセッションの保存は最新のものだけを書けばよい
+        self._dirty[snapshot.author_id] = snapshot
+
+    def discard(self, author_id: int) -> None:
+        self._dirty[author_id] = None
+
+    async def load_all(self) -> list[SessionSnapshot]:
+        await self.flush()
+        async with self.db.execute(LOAD_SNAPSHOTS_SQL) as cursor:
+            rows = await cursor.fetchall()
+        snapshots = []
+        for row in rows:
+            try:
+                snapshots.append(SessionSnapshot.from_row(row))
+            except (ValueError, KeyError) as e:
+                print(f"[DEBUG] セッションスナップショットを読み込めませんでした (author_id={row[0]}): {e}")
+        return snapshots
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            upserts = [snapshot.to_row() for snapshot in dirty.values() if snapshot is not None]
+            deletes = [(author_id,) for author_id, snapshot in dirty.items() if snapshot is None]
+            try:
+                if upserts:
+                    await self.db.executemany(UPSERT_SNAPSHOT_SQL, upserts)
+                if deletes:
+                    await self.db.executemany(DELETE_SNAPSHOT_SQL, deletes)
+                await self.db.commit()
+            except Exception:
+                await self.db.rollback()
+                for author_id, snapshot in dirty.items():
+                    self._dirty.setdefault(author_id, snapshot)
+                raise
+            self.writes += 1
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[DEBUG] セッションスナップショットの書き込みに失敗しました: {e}")
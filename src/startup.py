@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import time
+from typing import Awaitable, TypeVar
+
+from metrics import Metrics
+
+
+T = TypeVar("T")
+
+
+class StartupTimer:
+    # 起動の段階ごとにかかった時間を記録し、1行にまとめて出力する。並行して進む段階は時間が重なる
+    def __init__(self, started: float, metrics: Metrics | None = None):
+        self.started = started
+        self.steps: dict[str, float] = {}
+        self._seconds = (metrics or Metrics()).gauge(
+            "pomo_startup_seconds", "Seconds spent in each startup step of the current process."
+        )
+
+    def record(self, name: str, seconds: float) -> None:
+        self.steps[name] = seconds
+        self._seconds.set(seconds, step=name)
+
+    async def step(self, name: str, awaitable: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self, label: str) -> None:
+        total = time.perf_counter() - self.started
+        breakdown = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.steps.items())
+        self._seconds.set(total, step=label)
+        print(f"[DEBUG] 起動時間 ({label}): {total * 1000:.0f}ms [{breakdown}]")
@@ -1,75 +1,491 @@
 from __future__ import annotations
 
-import aiosqlite
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
 from pathlib import Path
+from typing import AsyncIterator
+
+import aiosqlite
+
+from leaderboard import Leaderboard
+from metrics import Metrics
+from tracing import Tracer
 
 
 DEFAULT_DB_FILE = str(Path(__file__).resolve().parent.parent / "assets" / "pomo.db")
 
+# 同じSQL文字列を使い回すことで sqlite3 の文キャッシュに載せる
+ADD_STATS_SQL = """
+INSERT INTO stats (user_id, total_minutes, sessions)
+VALUES (?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET
+total_minutes = total_minutes + excluded.total_minutes,
+sessions = sessions + excluded.sessions
+"""
+ADD_EVENT_SQL = """
+INSERT INTO work_events (user_id, guild_id, minute, minutes, sessions)
+VALUES (?, ?, ?, ?, ?)
+"""
+# window -> (ロールアップ表, 期間列)。all は期間なしのギルド別累計
+ROLLUPS = {
+    "today": ("daily_stats", "day"),
+    "week": ("weekly_stats", "week"),
+    "month": ("monthly_stats", "month"),
+    "all": ("guild_stats", "period"),
+}
+ADD_ROLLUP_SQLS = {
+    window: f"""
+    INSERT INTO {table} (user_id, {column}, guild_id, minutes, sessions)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, {column}, guild_id) DO UPDATE SET
+    minutes = minutes + excluded.minutes,
+    sessions = sessions + excluded.sessions
+    """
+    for window, (table, column) in ROLLUPS.items()
+}
+GET_ROLLUP_SQLS = {
+    window: f"""
+    SELECT COALESCE(SUM(minutes), 0), COALESCE(SUM(sessions), 0), COUNT(*)
+    FROM {table} WHERE user_id = ? AND {column} = ?
+    """
+    for window, (table, column) in ROLLUPS.items()
+}
+# 起動時にギルドごとの上位だけを (期間, guild_id, minutes DESC) 索引から読む
+RANK_ROLLUP_SQLS = {
+    window: f"""
+    SELECT guild_id, user_id, minutes FROM (
+        SELECT guild_id, user_id, minutes,
+        ROW_NUMBER() OVER (PARTITION BY guild_id ORDER BY minutes DESC) AS rank
+        FROM {table} WHERE {column} = ?
+    ) WHERE rank <= ?
+    """
+    for window, (table, column) in ROLLUPS.items()
+}
+RANK_GUILD_SQLS = {
+    window: f"""
+    SELECT user_id, minutes FROM {table}
+    WHERE {column} = ? AND guild_id = ? ORDER BY minutes DESC LIMIT ?
+    """
+    for window, (table, column) in ROLLUPS.items()
+}
+GET_STATS_SQL = "SELECT total_minutes, sessions FROM stats WHERE user_id = ?"
+# 主キー (user_id, day, guild_id) の範囲読みだけで日別の合計が取れる
+GET_DAILY_SQL = "SELECT day, SUM(minutes) FROM daily_stats WHERE user_id = ? AND day > ? GROUP BY day"
+RESET_STATS_SQL = "DELETE FROM stats WHERE user_id = ? RETURNING total_minutes, sessions"
+RESET_HISTORY_SQLS = (
+    "DELETE FROM work_events WHERE user_id = ?",
+    *(f"DELETE FROM {table} WHERE user_id = ?" for table, _ in ROLLUPS.values()),
+)
+READBACK_CHUNK = 300
+
+SCHEMA_SQLS = (
+    """
+    CREATE TABLE IF NOT EXISTS stats (
+        user_id INTEGER PRIMARY KEY,
+        total_minutes INTEGER DEFAULT 0,
+        sessions INTEGER DEFAULT 0
+    )
+    """,
+    # 追記のみの作業ログ。minute は UNIX 時刻の分番号
+    """
+    CREATE TABLE IF NOT EXISTS work_events (
+        user_id INTEGER NOT NULL,
+        guild_id INTEGER NOT NULL,
+        minute INTEGER NOT NULL,
+        minutes INTEGER NOT NULL,
+        sessions INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_work_events_user_minute ON work_events (user_id, minute)",
+    # day / week / month はローカル日付基準の通し番号 (week は月曜始まり)
+    *(
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            user_id INTEGER NOT NULL,
+            {column} INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
+            minutes INTEGER DEFAULT 0,
+            sessions INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, {column}, guild_id)
+        ) WITHOUT ROWID
+        """
+        for table, column in ROLLUPS.values()
+    ),
+    *(
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_rank ON {table} ({column}, guild_id, minutes DESC)"
+        for table, column in ROLLUPS.values()
+    ),
+)
+# 履歴表より前に作られたDB向けに、作業ログから月別・ギルド別集計を一度だけ作る
+BACKFILL_SQLS = (
+    """
+    INSERT INTO guild_stats (user_id, period, guild_id, minutes, sessions)
+    SELECT user_id, 0, guild_id, SUM(minutes), SUM(sessions) FROM work_events
+    WHERE NOT EXISTS (SELECT 1 FROM guild_stats)
+    GROUP BY user_id, guild_id
+    """,
+    """
+    INSERT INTO monthly_stats (user_id, month, guild_id, minutes, sessions)
+    SELECT user_id,
+        CAST(strftime('%Y', day * 86400, 'unixepoch') AS INTEGER) * 12
+        + CAST(strftime('%m', day * 86400, 'unixepoch') AS INTEGER) - 1,
+        guild_id, SUM(minutes), SUM(sessions)
+    FROM daily_stats
+    WHERE NOT EXISTS (SELECT 1 FROM monthly_stats)
+    GROUP BY 1, 2, 3
+    """,
+)
+
+WINDOWS = ("today", "week", "month")
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+@functools.lru_cache(maxsize=4096)
+def _utc_offset_minutes(minute: int) -> int:
+    # 夏時間の切り替えで UTC とのずれが変わるので、起動時ではなくその分の時点のずれを使う
+    local = datetime.fromtimestamp(minute * 60, timezone.utc).astimezone()
+    return int(local.utcoffset().total_seconds() // 60)
+
+
+def _timed(method):
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        with self._latency.time(op=method.__name__), self.tracer.span(f"stats.{method.__name__}"):
+            return await method(self, *args, **kwargs)
+
+    return wrapper
+
 
 class StatsRepository:
-    def __init__(self, db_file: str = DEFAULT_DB_FILE):
+    FLUSH_INTERVAL_SECONDS = 30.0
+    FLUSH_THRESHOLD = 500
+    # 閾値を超えても少し待ち、同じ区切りで終わったセッションの加算を1トランザクションにまとめる
+    FLUSH_COALESCE_SECONDS = 0.5
+    CACHE_SIZE = 1024
+
+    def __init__(
+        self,
+        db_file: str = DEFAULT_DB_FILE,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        flush_threshold: int = FLUSH_THRESHOLD,
+        cache_size: int = CACHE_SIZE,
+        metrics: Metrics | None = None,
+        tracer: Tracer | None = None,
+    ):
         self.db_file = db_file
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.cache_size = cache_size
+        # user_id -> [total_minutes, sessions]。書き込み待ちの差分も含めた最新値
+        self._cache: OrderedDict[int, list[int]] = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._db: aiosqlite.Connection | None = None
+        # 書き込み待ちの差分: (user_id, guild_id, minute) -> [minutes, sessions]
+        self._pending: dict[tuple[int, int, int], list[int]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self._threshold_flush: asyncio.Task | None = None
+        self.leaderboard = Leaderboard()
+        self.tracer = tracer or Tracer()
+        self._latency = (metrics or Metrics()).histogram(
+            "pomo_stats_call_seconds", "StatsRepository call latency, including buffered writes and cache hits."
+        )
 
     async def init(self) -> None:
-        async with aiosqlite.connect(self.db_file) as db:
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS stats (
-                    user_id INTEGER PRIMARY KEY,
-                    total_minutes INTEGER DEFAULT 0,
-                    sessions INTEGER DEFAULT 0
-                )
-                """
-            )
-            await db.commit()
+        if self._db is None:
+            self._db = await aiosqlite.connect(self.db_file)
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            await self._db.execute("PRAGMA synchronous=NORMAL")
+        for sql in SCHEMA_SQLS:
+            await self._db.execute(sql)
+        for sql in BACKFILL_SQLS:
+            await self._db.execute(sql)
+        await self._db.commit()
+        await self._load_leaderboards()
+        if self._flush_task is None and self.flush_interval > 0:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._threshold_flush is not None:
+            await asyncio.gather(self._threshold_flush, return_exceptions=True)
+            self._threshold_flush = None
+        if self._db is None:
+            return
+        await self.flush()
+        db, self._db = self._db, None
+        await db.close()
+
+    @property
+    def db(self) -> aiosqlite.Connection:
+        if self._db is None:
+            raise RuntimeError("StatsRepository.init() が呼ばれていません。")
+        return self._db
 
-    async def add_work_minutes(self, user_ids: list[int], minutes: int) -> None:
+    @_timed
+    async def add_work_minutes(self, user_ids: list[int], minutes: int, guild_id: int = 0) -> None:
         if not user_ids or minutes <= 0:
             return
-        async with aiosqlite.connect(self.db_file) as db:
-            await db.executemany(
-                """
-                INSERT INTO stats (user_id, total_minutes, sessions)
-                VALUES (?, ?, 0)
-                ON CONFLICT(user_id) DO UPDATE SET
-                total_minutes = total_minutes + ?
-                """,
-                [(uid, minutes, minutes) for uid in user_ids],
-            )
-            await db.commit()
+        minute = self._current_minute()
+        periods = [(window, self._period_of(window, minute)) for window in ROLLUPS]
+        for uid in user_ids:
+            self._pending.setdefault((uid, guild_id, minute), [0, 0])[0] += minutes
+            cached = self._cache.get(uid)
+            if cached is not None:
+                cached[0] += minutes
+            for window, period in periods:
+                self.leaderboard.add(guild_id, window, period, uid, minutes)
+        await self._maybe_flush()
 
-    async def add_completed_session(self, user_ids: list[int]) -> None:
+    @_timed
+    async def add_completed_session(self, user_ids: list[int], guild_id: int = 0) -> None:
         if not user_ids:
             return
-        async with aiosqlite.connect(self.db_file) as db:
-            await db.executemany(
-                """
-                INSERT INTO stats (user_id, total_minutes, sessions)
-                VALUES (?, 0, 1)
-                ON CONFLICT(user_id) DO UPDATE SET
-                sessions = sessions + 1
-                """,
-                [(uid,) for uid in user_ids],
+        minute = self._current_minute()
+        for uid in user_ids:
+            self._pending.setdefault((uid, guild_id, minute), [0, 0])[1] += 1
+            cached = self._cache.get(uid)
+            if cached is not None:
+                cached[1] += 1
+        await self._maybe_flush()
+
+    @_timed
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            await self._flush_locked()
+
+    @asynccontextmanager
+    async def exclusive(self) -> AsyncIterator[None]:
+        # 別の接続でDBを丸ごと書き換える間 (一括読み込みなど)、書き込み待ちの差分を先に書いて加算を止めておく。
+        # 抜けるときにキャッシュとランキングを読み直す
+        async with self._flush_lock:
+            await self._flush_locked()
+            try:
+                yield
+            finally:
+                self._cache.clear()
+                self.leaderboard = Leaderboard(self.leaderboard.capacity)
+                await self._load_leaderboards()
+
+    async def _flush_locked(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            rollups = await self._write(pending)
+        except Exception:
+            await self.db.rollback()
+            for key, (minutes, sessions) in pending.items():
+                delta = self._pending.setdefault(key, [0, 0])
+                delta[0] += minutes
+                delta[1] += sessions
+            raise
+        # コミット済みの差分だけをランキングへ反映する
+        for window, deltas in rollups.items():
+            await self._update_leaderboard(window, [key for key, (m, _) in deltas.items() if m > 0])
+
+    async def _write(
+        self, pending: dict[tuple[int, int, int], list[int]]
+    ) -> dict[str, dict[tuple[int, int, int], list[int]]]:
+        totals: dict[int, list[int]] = {}
+        rollups: dict[str, dict[tuple[int, int, int], list[int]]] = {window: {} for window in ROLLUPS}
+        events = []
+        # 同じ区切りの差分は分番号がほぼ同じなので、期間の計算は分ごとに1回だけ行う
+        periods: dict[int, tuple[int, ...]] = {}
+        for (uid, guild_id, minute), (minutes, sessions) in pending.items():
+            events.append((uid, guild_id, minute, minutes, sessions))
+            minute_periods = periods.get(minute)
+            if minute_periods is None:
+                minute_periods = periods[minute] = tuple(self._period_of(w, minute) for w in ROLLUPS)
+            for table, key in (
+                (totals, uid),
+                *((rollups[w], (uid, period, guild_id)) for w, period in zip(ROLLUPS, minute_periods)),
+            ):
+                delta = table.setdefault(key, [0, 0])
+                delta[0] += minutes
+                delta[1] += sessions
+
+        await self.db.executemany(ADD_STATS_SQL, [(uid, m, s) for uid, (m, s) in totals.items()])
+        await self.db.executemany(ADD_EVENT_SQL, events)
+        for window, deltas in rollups.items():
+            await self.db.executemany(ADD_ROLLUP_SQLS[window], [(*key, m, s) for key, (m, s) in deltas.items()])
+        await self.db.commit()
+        return rollups
+
+    async def _update_leaderboard(self, window: str, keys: list[tuple[int, int, int]]) -> None:
+        # 圏外から上がってくるユーザーも正しく並べるため、書き込んだ行の合計値を読み戻す
+        table, column = ROLLUPS[window]
+        # 書き込み中に届いた差分は盤面に足し済みなので、読み戻した合計 (まだ含まない) に足し直す
+        unflushed: dict[tuple[int, int, int], int] = {}
+        for (uid, guild_id, minute), (minutes, _) in self._pending.items():
+            key = (uid, self._period_of(window, minute), guild_id)
+            unflushed[key] = unflushed.get(key, 0) + minutes
+        for offset in range(0, len(keys), READBACK_CHUNK):
+            chunk = keys[offset:offset + READBACK_CHUNK]
+            placeholders = ", ".join(["(?, ?, ?)"] * len(chunk))
+            sql = (
+                f"SELECT user_id, {column}, guild_id, minutes FROM {table} "
+                f"WHERE (user_id, {column}, guild_id) IN (VALUES {placeholders})"
             )
-            await db.commit()
+            params = [value for key in chunk for value in key]
+            async with self.db.execute(sql, params) as cursor:
+                async for user_id, period, guild_id, minutes in cursor:
+                    minutes += unflushed.get((user_id, period, guild_id), 0)
+                    self.leaderboard.update(guild_id, window, period, user_id, minutes)
+
+    async def prewarm(self) -> None:
+        # コマンドで使う読み取り文を一度実行し、文キャッシュと stats のページを読み込んでおく
+        reads = [
+            ("SELECT COUNT(*), SUM(total_minutes) FROM stats", ()),
+            (GET_STATS_SQL, (0,)),
+            (GET_DAILY_SQL, (0, 0)),
+            *((sql, (0, 0)) for sql in GET_ROLLUP_SQLS.values()),
+        ]
+        for sql, params in reads:
+            async with self.db.execute(sql, params) as cursor:
+                await cursor.fetchall()
+
+    async def _load_leaderboards(self) -> None:
+        minute = self._current_minute()
+        for window in ROLLUPS:
+            period = self._period_of(window, minute)
+            rows: dict[int, list[tuple[int, int]]] = {}
+            async with self.db.execute(RANK_ROLLUP_SQLS[window], (period, self.leaderboard.capacity)) as cursor:
+                async for guild_id, user_id, minutes in cursor:
+                    rows.setdefault(guild_id, []).append((user_id, minutes))
+            for guild_id, guild_rows in rows.items():
+                self.leaderboard.load(guild_id, window, period, guild_rows)
+
+    @_timed
+    async def get_leaderboard(self, guild_id: int, window: str = "all", limit: int = 10) -> list[tuple[int, int]]:
+        # 書き込み待ちの差分は add_work_minutes で盤面に足してあるので、ここでは書き込まない
+        period = self._period_of(window, self._current_minute())
+        if self.leaderboard.is_stale(guild_id, window, period):
+            params = (period, guild_id, self.leaderboard.capacity)
+            async with self.db.execute(RANK_GUILD_SQLS[window], params) as cursor:
+                rows = await cursor.fetchall()
+            self.leaderboard.load(guild_id, window, period, [(user_id, minutes) for user_id, minutes in rows])
+            for (uid, pending_guild, minute), (minutes, _) in self._pending.items():
+                if pending_guild == guild_id and minutes > 0 and self._period_of(window, minute) == period:
+                    self.leaderboard.add(guild_id, window, period, uid, minutes)
+        return self.leaderboard.top(guild_id, window, period, limit)
+
+    async def _maybe_flush(self) -> None:
+        # 大部屋の1分ぶんの加算で閾値を超えても、呼び出し元のタイマーは書き込み完了を待たない
+        if len(self._pending) < self.flush_threshold:
+            return
+        if self._threshold_flush is None or self._threshold_flush.done():
+            self._threshold_flush = asyncio.create_task(self._flush_coalesced())
 
+    async def _flush_coalesced(self) -> None:
+        await asyncio.sleep(self.FLUSH_COALESCE_SECONDS)
+        await self._flush_logged()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush_logged()
+
+    async def _flush_logged(self) -> None:
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"[DEBUG] 統計の書き込みに失敗しました: {e}")
+
+    @_timed
     async def get_stats(self, user_id: int) -> tuple[int, int] | None:
-        async with aiosqlite.connect(self.db_file) as db:
-            async with db.execute(
-                "SELECT total_minutes, sessions FROM stats WHERE user_id = ?",
-                (user_id,),
-            ) as cursor:
+        cached = self._cache.get(user_id)
+        if cached is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(user_id)
+            return cached[0], cached[1]
+
+        self.cache_misses += 1
+        # ロック中は flush が走らないので、SELECT 後に届いた差分だけを足せば正確な値になる
+        async with self._flush_lock:
+            await self._flush_locked()
+            async with self.db.execute(GET_STATS_SQL, (user_id,)) as cursor:
                 row = await cursor.fetchone()
-        if row:
+            totals = [row[0], row[1]] if row else [0, 0]
+            for (uid, _, _), (minutes, sessions) in self._pending.items():
+                if uid == user_id:
+                    totals[0] += minutes
+                    totals[1] += sessions
+        if not row and totals == [0, 0]:
+            return None
+        self._cache[user_id] = totals
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return totals[0], totals[1]
+
+    @_timed
+    async def get_window_stats(self, user_id: int, window: str) -> tuple[int, int] | None:
+        if window not in WINDOWS:
+            raise ValueError(f"unknown window: {window}")
+        await self.flush()
+        period = self._period_of(window, self._current_minute())
+        async with self.db.execute(GET_ROLLUP_SQLS[window], (user_id, period)) as cursor:
+            row = await cursor.fetchone()
+        if row and row[2] > 0:
             return row[0], row[1]
         return None
 
+    @_timed
+    async def get_daily_minutes(self, user_id: int, days: int) -> tuple[int, list[tuple[int, int]]]:
+        await self.flush()
+        today = self._day_of(self._current_minute())
+        async with self.db.execute(GET_DAILY_SQL, (user_id, today - days)) as cursor:
+            rows = await cursor.fetchall()
+        return today, [(day, minutes) for day, minutes in rows]
+
+    @_timed
     async def reset_stats(self, user_id: int) -> tuple[int, int] | None:
-        before = await self.get_stats(user_id)
-        if before is None:
-            return None
-        async with aiosqlite.connect(self.db_file) as db:
-            await db.execute("DELETE FROM stats WHERE user_id = ?", (user_id,))
-            await db.commit()
-        return before
+        # 削除とコミットの間に書き込み待ちの差分が割り込まないよう、最後までロックを持つ
+        async with self._flush_lock:
+            await self._flush_locked()
+            try:
+                async with self.db.execute(RESET_STATS_SQL, (user_id,)) as cursor:
+                    row = await cursor.fetchone()
+                for sql in RESET_HISTORY_SQLS:
+                    await self.db.execute(sql, (user_id,))
+                await self.db.commit()
+            except Exception:
+                await self.db.rollback()
+                raise
+            self._cache.pop(user_id, None)
+            self.leaderboard.discard_user(user_id)
+        if row:
+            return row[0], row[1]
+        return None
+
+    def _current_minute(self) -> int:
+        return int(time.time() // 60)
+
+    def _day_of(self, minute: int) -> int:
+        return (minute + _utc_offset_minutes(minute)) // 1440
+
+    def _week_of(self, day: int) -> int:
+        # 1970-01-01 は木曜日なので 3 日ずらして月曜始まりにする
+        return (day + 3) // 7
+
+    def _month_of(self, day: int) -> int:
+        local = date.fromordinal(EPOCH_ORDINAL + day)
+        return local.year * 12 + local.month - 1
+
+    def _period_of(self, window: str, minute: int) -> int:
+        day = self._day_of(minute)
+        if window == "today":
+            return day
+        if window == "week":
+            return self._week_of(day)
+        if window == "month":
+            return self._month_of(day)
+        return 0
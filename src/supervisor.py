@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+from shard import ShardLayout, ShardLayoutMismatch
+
+
+TIMER_SCRIPT = str(Path(__file__).resolve().parent / "timer.py")
+# timer.py の DB_FILE と同じ場所
+DB_FILE = str(Path(__file__).resolve().parent.parent / "assets" / "pomo.db")
+
+
+class ShardSupervisor:
+    # 連続して落ちるプロセスほど再起動を遅らせる
+    RESTART_BACKOFF_SECONDS = (1.0, 2.0, 5.0, 10.0, 30.0)
+    # これだけ動き続けたら再起動回数をリセットする
+    STABLE_SECONDS = 60.0
+    STOP_TIMEOUT_SECONDS = 15.0
+
+    def __init__(
+        self,
+        command: list[str],
+        process_count: int,
+        shard_count: int,
+        base_port: int = ShardLayout.base_port,
+        env: dict[str, str] | None = None,
+    ):
+        self.command = command
+        self.process_count = process_count
+        self.shard_count = shard_count
+        self.base_port = base_port
+        self.env = dict(os.environ if env is None else env)
+        self._processes: dict[int, asyncio.subprocess.Process] = {}
+        self._stopping = asyncio.Event()
+        self.restarts = 0
+
+    def layout(self, process_index: int) -> ShardLayout:
+        return ShardLayout(self.shard_count, self.process_count, process_index, self.base_port)
+
+    async def run(self) -> None:
+        await asyncio.gather(*(self._keep_alive(i) for i in range(self.process_count)))
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        for process in self._processes.values():
+            if process.returncode is None:
+                process.terminate()
+        for index, process in list(self._processes.items()):
+            try:
+                await asyncio.wait_for(process.wait(), self.STOP_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                print(f"[DEBUG] シャードプロセス {index} が終了しないため強制終了します。")
+                process.kill()
+                await process.wait()
+
+    def pid(self, process_index: int) -> int | None:
+        process = self._processes.get(process_index)
+        return process.pid if process is not None and process.returncode is None else None
+
+    async def _keep_alive(self, index: int) -> None:
+        failures = 0
+        while not self._stopping.is_set():
+            env = {
+                **self.env,
+                "POMO_SHARD_COUNT": str(self.shard_count),
+                "POMO_PROCESS_COUNT": str(self.process_count),
+                "POMO_PROCESS_INDEX": str(index),
+                "POMO_PEER_BASE_PORT": str(self.base_port),
+            }
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(*self.command, env=env)
+            self._processes[index] = process
+            print(f"[DEBUG] シャードプロセス {index} (shards {self.layout(index).shard_ids}) を起動しました: pid={process.pid}")
+            code = await process.wait()
+            if self._stopping.is_set():
+                return
+
+            failures = 1 if time.monotonic() - started >= self.STABLE_SECONDS else failures + 1
+            delay = self.RESTART_BACKOFF_SECONDS[min(failures, len(self.RESTART_BACKOFF_SECONDS)) - 1]
+            self.restarts += 1
+            print(f"[DEBUG] シャードプロセス {index} が終了しました (code={code})。{delay:g}秒後に再起動します。")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="シャードごとに timer.py のプロセスを起動・監視する")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, default=None, help="総シャード数 (既定はプロセス数と同じ)")
+    parser.add_argument("--base-port", type=int, default=ShardLayout.base_port, help="プロセス間集計APIの先頭ポート")
+    parser.add_argument("command", nargs="*", help="起動するコマンド (既定は src/timer.py)")
+    return parser.parse_args(argv)
+
+
+async def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    supervisor = ShardSupervisor(
+        args.command or [sys.executable, TIMER_SCRIPT],
+        process_count=args.processes,
+        shard_count=args.shards or args.processes,
+        base_port=args.base_port,
+    )
+    # プロセスを起動する前に、DBの構成が前回と同じか確かめる (分割前のDBは最初の1回だけ分ける)
+    try:
+        await asyncio.to_thread(supervisor.layout(0).prepare_db_files, DB_FILE)
+    except ShardLayoutMismatch as e:
+        sys.exit(f"エラー: {e}")
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: asyncio.ensure_future(supervisor.stop()))
+    await supervisor.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,17 +1,33 @@
 from __future__ import annotations
 
-import asyncio
-import importlib.util
-import os
-from pathlib import Path
-
-import discord
-from discord.ext import commands
-
-from audio import AudioPlayer
-from cog import PomoCog
-from session import SessionManager
-from storage import StatsRepository
+import time
+
+# discord.py などの読み込みも起動時間の内訳に含める
+STARTED = time.perf_counter()
+
+import asyncio  # noqa: E402
+import importlib.util  # noqa: E402
+import os  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+import discord  # noqa: E402
+from discord.ext import commands  # noqa: E402
+
+from audio import AudioPlayer  # noqa: E402
+from charts import ChartRenderer  # noqa: E402
+from cog import PomoCog  # noqa: E402
+from metrics import Metrics, MetricsServer, register_runtime  # noqa: E402
+from outbox import Outbox  # noqa: E402
+from presence import VoicePresence  # noqa: E402
+from profiler import SamplingProfiler  # noqa: E402
+from scheduler import TimerScheduler  # noqa: E402
+from session import SessionManager  # noqa: E402
+from shard import ShardLayout, ShardRouter  # noqa: E402
+from snapshot import SessionStore  # noqa: E402
+from startup import StartupTimer  # noqa: E402
+from storage import StatsRepository  # noqa: E402
+from tracing import Tracer  # noqa: E402
+from voice import VoicePool  # noqa: E402
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -38,6 +54,37 @@ def has_voice_runtime_dependencies(strict: bool = True) -> bool:
     return not strict
 
 
+def env_flag(name: str, default: bool) -> bool:
+    raw = os.getenv(name, "").strip().lower()
+    if not raw:
+        return default
+    return raw not in {"0", "false", "off", "no"}
+
+
+def env_number(name: str, default: float) -> float:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        print(f"警告: {name}={raw!r} は数値ではないため既定値 {default} を使います。")
+        return default
+
+
+async def prewarm(startup: StartupTimer, stats: StatsRepository, charts: ChartRenderer) -> None:
+    # ログインを待つ間に、最初のコマンドで払うはずの準備 (DBの読み込み・描画プロセスの起動) を済ませる
+    try:
+        await asyncio.gather(
+            startup.step("prewarm.db", stats.prewarm()),
+            startup.step("prewarm.charts", charts.prewarm()),
+        )
+    except Exception as e:
+        print(f"[DEBUG] 事前準備に失敗しました: {e!r}")
+        return
+    startup.report("事前準備完了")
+
+
 async def main():
     token = os.getenv("DISCORD_BOT_TOKEN")
     if not token:
@@ -46,25 +93,115 @@ async def main():
         print("  export DISCORD_BOT_TOKEN='your_token_here'")
         raise SystemExit(1)
 
-    strict_voice_deps = os.getenv("POMO_STRICT_VOICE_DEPS", "1").strip().lower() not in {"0", "false", "off", "no"}
-    if not has_voice_runtime_dependencies(strict=strict_voice_deps):
-        raise SystemExit(1)
+    metrics = Metrics()
+    startup = StartupTimer(STARTED, metrics)
+    startup.record("import", time.perf_counter() - STARTED)
+    strict_voice_deps = env_flag("POMO_STRICT_VOICE_DEPS", True)
 
     ASSETS_DIR.mkdir(parents=True, exist_ok=True)
 
-    stats = StatsRepository(DB_FILE)
-    await stats.init()
+    # supervisor.py から起動された場合はシャード範囲ごとにDBとセッションを分ける
+    layout = ShardLayout.from_env()
+    db_file = layout.db_file(DB_FILE) if layout else DB_FILE
+
+    # 未設定なら無効 (スパンは使い回しの空オブジェクトになり計測しない)
+    trace_slow_ms = env_number("POMO_TRACE_SLOW_MS", 0)
+    tracer = Tracer(enabled=trace_slow_ms > 0, slow_ms=trace_slow_ms or Tracer.SLOW_MS)
+    stats = StatsRepository(db_file, metrics=metrics, tracer=tracer)
+    snapshots = SessionStore(db_file)
+    router = ShardRouter(layout, stats)
+    charts = ChartRenderer(
+        router,
+        workers=int(env_number("POMO_CHART_WORKERS", ChartRenderer.MAX_WORKERS)),
+        tracer=tracer,
+    )
 
     manager = SessionManager()
-    audio = AudioPlayer(SOUND_FILE)
+    audio = AudioPlayer(SOUND_FILE, metrics=metrics, tracer=tracer)
+    scheduler = TimerScheduler()
+    presence = VoicePresence()
+    outbox = Outbox(tracer=tracer)
+    voice = VoicePool(
+        idle_seconds=env_number("POMO_VOICE_IDLE_SECONDS", VoicePool.IDLE_SECONDS),
+        max_idle=int(env_number("POMO_VOICE_MAX_IDLE", VoicePool.MAX_IDLE)),
+    )
+
+    profiler = SamplingProfiler(ASSETS_DIR / "profiles")
+
+    register_runtime(metrics, manager, scheduler, outbox, voice, stats)
+    metrics_server = None
+    metrics_port = int(env_number("POMO_METRICS_PORT", 0))
+    if metrics_port > 0:
+        if layout:
+            metrics_port += layout.process_index
+        metrics_server = MetricsServer(metrics, os.getenv("POMO_METRICS_HOST", "127.0.0.1"), metrics_port)
 
     intents = discord.Intents.default()
     intents.message_content = True
     intents.voice_states = True
-    bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
-
-    await bot.add_cog(PomoCog(bot, manager, stats, audio))
-    await bot.start(token)
+    if layout:
+        bot = commands.AutoShardedBot(
+            command_prefix="!",
+            intents=intents,
+            help_command=None,
+            shard_count=layout.shard_count,
+            shard_ids=layout.shard_ids,
+        )
+    else:
+        bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
+
+    async def report_ready() -> None:
+        # on_ready は再接続のたびに呼ばれるので最初の1回だけ出力する
+        if "ready" not in startup.steps:
+            startup.record("ready", time.perf_counter() - connect_started)
+            startup.report("ログイン完了")
+
+    bot.add_listener(report_ready, "on_ready")
+    prewarming: asyncio.Task | None = None
+    try:
+        # 互いに依存しない初期化は並行して行う。DBの2つの接続はそれぞれ別スレッドで動き、
+        # 通知音のデコードは FFmpeg の子プロセス、ログインは Discord への HTTP 待ちになる
+        results = await asyncio.gather(
+            startup.step("voice_deps", asyncio.to_thread(has_voice_runtime_dependencies, strict_voice_deps)),
+            startup.step("db", asyncio.gather(stats.init(), snapshots.init())),
+            startup.step("audio", audio.load()),
+            startup.step("login", bot.login(token)),
+            return_exceptions=True,
+        )
+        # 失敗があっても他の初期化が終わるのを待ってから後片付けに進む
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        if not results[0]:
+            raise SystemExit(1)
+        await startup.step("router", router.start())
+        if metrics_server is not None:
+            await metrics_server.start()
+
+        await bot.add_cog(
+            PomoCog(
+                bot, manager, stats, audio, scheduler, presence, outbox, snapshots, voice, tracer, profiler, router, charts
+            )
+        )
+        startup.report("初期化完了")
+        if env_flag("POMO_PREWARM", True):
+            prewarming = asyncio.create_task(prewarm(startup, stats, charts))
+        connect_started = time.perf_counter()
+        await bot.connect()
+    finally:
+        if prewarming is not None:
+            prewarming.cancel()
+            await asyncio.gather(prewarming, return_exceptions=True)
+        if not bot.is_closed():
+            await bot.close()
+        if metrics_server is not None:
+            await metrics_server.close()
+        scheduler.close()
+        charts.close()
+        await voice.close()
+        await router.close()
+        await snapshots.close()
+        await stats.close()
 
 
 if __name__ == "__main__":
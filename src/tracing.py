@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import json
+import time
+from contextvars import ContextVar, Token
+from typing import Any
+
+
+_current: ContextVar[Span | None] = ContextVar("pomo_span", default=None)
+
+
+class _NoopSpan:
+    # 無効時はこの1個を使い回し、計測処理を一切しない
+    def __enter__(self) -> _NoopSpan:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def finish(self, error: str | None = None) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "attrs", "parent", "start", "duration", "children", "_token")
+
+    def __init__(self, tracer: Tracer, name: str, attrs: dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.parent: Span | None = None
+        self.start = 0.0
+        self.duration = 0.0
+        # 子スパン名 -> [回数, 合計秒]。遅いスパンのログにどこで時間を使ったかを載せる
+        self.children: dict[str, list] = {}
+        self._token: Token | None = None
+
+    def __enter__(self) -> Span:
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.finish(exc_type.__name__ if exc_type is not None else None)
+        return False
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def finish(self, error: str | None = None) -> None:
+        if self._token is None:
+            return
+        self.duration = time.perf_counter() - self.start
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # 開始と別のコンテキストで閉じた場合
+            _current.set(self.parent)
+        self._token = None
+        if error is not None:
+            self.attrs["error"] = error
+        if self.parent is not None:
+            child = self.parent.children.setdefault(self.name, [0, 0.0])
+            child[0] += 1
+            child[1] += self.duration
+        self.tracer._finished(self)
+
+
+class Tracer:
+    SLOW_MS = 250.0
+
+    def __init__(self, enabled: bool = False, slow_ms: float = SLOW_MS):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.spans = 0
+        self.slow = 0
+
+    def span(self, name: str, **attrs) -> Span | _NoopSpan:
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def start(self, name: str, **attrs) -> Span | _NoopSpan:
+        # with で囲めない区間用。finish() で閉じる
+        span = self.span(name, **attrs)
+        span.__enter__()
+        return span
+
+    def _finished(self, span: Span) -> None:
+        self.spans += 1
+        ms = span.duration * 1000
+        if ms < self.slow_ms:
+            return
+        self.slow += 1
+        record = {
+            "span": span.name,
+            "ms": round(ms, 1),
+            "parent": span.parent.name if span.parent is not None else None,
+            "attrs": span.attrs,
+            "children": {
+                name: {"count": count, "ms": round(seconds * 1000, 1)}
+                for name, (count, seconds) in sorted(span.children.items(), key=lambda item: -item[1][1])
+            },
+        }
+        print(f"[TRACE] {json.dumps(record, ensure_ascii=False, default=str)}")
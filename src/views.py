@@ -1,51 +1,119 @@
 from __future__ import annotations
 
+import re
+
 import discord
-from discord.ui import Button, View
+from discord.ui import Button, DynamicItem, View
 
 from session import PomoSession, SessionManager
 
 
-class PomoView(View):
-    def __init__(self, session: PomoSession):
-        super().__init__(timeout=None)
-        self.session = session
-        self.paused = False
-        self.stopped = False
+# action -> (ラベル, スタイル, 絵文字)
+POMO_BUTTONS = {
+    "pause": ("一時停止", discord.ButtonStyle.secondary, "⏸️"),
+    "resume": ("再開", discord.ButtonStyle.success, "▶️"),
+    "stop": ("終了", discord.ButtonStyle.danger, "⏹️"),
+}
+JOIN_BUTTONS = {
+    "join": ("参加", discord.ButtonStyle.success, "🙋"),
+    "leave": ("退出", discord.ButtonStyle.secondary, "👋"),
+}
 
-    async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        return interaction.user.id in self.session.get_all_member_ids()
 
-    @discord.ui.button(label="一時停止", style=discord.ButtonStyle.secondary, emoji="⏸️")
-    async def pause_button(self, interaction: discord.Interaction, button: Button):
-        self.paused = True
-        button.disabled = True
-        self.children[1].disabled = False
-        await interaction.response.edit_message(content="⏸️ タイマーを一時停止しました。", view=self)
+def _resolve_session(
+    interaction: discord.Interaction, author_id: int
+) -> tuple[SessionManager, PomoSession] | None:
+    # ボタンは状態を持たないので、押されるたびに custom_id の author_id から引き直す
+    cog = interaction.client.get_cog("PomoCog")
+    manager: SessionManager | None = getattr(cog, "manager", None)
+    session = manager.get(author_id) if manager else None
+    if session is None or not session.active:
+        return None
+    return manager, session
 
-    @discord.ui.button(label="再開", style=discord.ButtonStyle.success, emoji="▶️", disabled=True)
-    async def resume_button(self, interaction: discord.Interaction, button: Button):
-        self.paused = False
-        button.disabled = True
-        self.children[0].disabled = False
-        await interaction.response.edit_message(content="▶️ タイマーを再開します。", view=self)
 
-    @discord.ui.button(label="終了", style=discord.ButtonStyle.danger, emoji="⏹️")
-    async def stop_button(self, interaction: discord.Interaction, button: Button):
-        self.stopped = True
-        await interaction.response.edit_message(content="⏹️ タイマーを終了しました。", view=None)
-        self.stop()
+class PomoButton(DynamicItem[Button], template=r"pomo:(?P<action>pause|resume|stop):(?P<author_id>[0-9]+)"):
+    def __init__(self, action: str, author_id: int, disabled: bool = False):
+        label, style, emoji = POMO_BUTTONS[action]
+        super().__init__(
+            Button(
+                label=label,
+                style=style,
+                emoji=emoji,
+                custom_id=f"pomo:{action}:{author_id}",
+                disabled=disabled,
+            )
+        )
+        self.action = action
+        self.author_id = author_id
+        self.session: PomoSession | None = None
 
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: Button, match: re.Match[str]) -> PomoButton:
+        return cls(match["action"], int(match["author_id"]))
 
-class JoinView(View):
-    def __init__(self, session: PomoSession, manager: SessionManager, author_id: int):
-        super().__init__(timeout=None)
-        self.session = session
-        self.manager = manager
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        resolved = _resolve_session(interaction, self.author_id)
+        if resolved is None:
+            await interaction.response.send_message("ℹ️ このタイマーは終了しています。", ephemeral=True)
+            return False
+        _, self.session = resolved
+        return self.session.is_member(interaction.user.id)
+
+    async def callback(self, interaction: discord.Interaction):
+        if self.action == "pause":
+            self.session.pause()
+            await interaction.response.edit_message(
+                content="⏸️ タイマーを一時停止しました。",
+                view=PomoView(self.author_id, paused=True),
+            )
+        elif self.action == "resume":
+            self.session.resume()
+            await interaction.response.edit_message(
+                content="▶️ タイマーを再開します。",
+                view=PomoView(self.author_id),
+            )
+        else:
+            self.session.request_stop()
+            await interaction.response.edit_message(content="⏹️ タイマーを終了しました。", view=None)
+
+
+class JoinButton(DynamicItem[Button], template=r"join:(?P<action>join|leave):(?P<author_id>[0-9]+)"):
+    def __init__(self, action: str, author_id: int, disabled: bool = False):
+        label, style, emoji = JOIN_BUTTONS[action]
+        super().__init__(
+            Button(
+                label=label,
+                style=style,
+                emoji=emoji,
+                custom_id=f"join:{action}:{author_id}",
+                disabled=disabled,
+            )
+        )
+        self.action = action
         self.author_id = author_id
+        self.manager: SessionManager | None = None
+        self.session: PomoSession | None = None
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: Button, match: re.Match[str]) -> JoinButton:
+        return cls(match["action"], int(match["author_id"]))
 
-    @discord.ui.button(label="参加", style=discord.ButtonStyle.success, emoji="🙋")
-    async def join_button(self, interaction: discord.Interaction, button: Button):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        resolved = _resolve_session(interaction, self.author_id)
+        if resolved is None:
+            await interaction.response.send_message("ℹ️ このタイマーは終了しています。", ephemeral=True)
+            return False
+        self.manager, self.session = resolved
+        return True
+
+    async def callback(self, interaction: discord.Interaction):
+        if self.action == "join":
+            await self._join(interaction)
+        else:
+            await self._leave(interaction)
+
+    async def _join(self, interaction: discord.Interaction):
         user = interaction.user
         if user.bot:
             await interaction.response.send_message("⚠️ Botは参加できません。", ephemeral=True)
@@ -56,8 +124,7 @@ class JoinView(View):
         else:
             await interaction.response.send_message("ℹ️ 既に参加済みです。", ephemeral=True)
 
-    @discord.ui.button(label="退出", style=discord.ButtonStyle.secondary, emoji="👋")
-    async def leave_button(self, interaction: discord.Interaction, button: Button):
+    async def _leave(self, interaction: discord.Interaction):
         user = interaction.user
 
         if user.id == self.session.host_id:
@@ -71,6 +138,7 @@ class JoinView(View):
                 )
             else:
                 self.session.stop_requested = True
+                self.session.notify()
                 print(f"[DEBUG] stop_requested=True (leave_button) host={user.id}")
                 await interaction.response.send_message(
                     f"👋 {user.mention} が退出しました。タイマーを終了します。"
@@ -82,3 +150,19 @@ class JoinView(View):
             await interaction.response.send_message(f"👋 {user.mention} が退出しました。", ephemeral=True)
         else:
             await interaction.response.send_message("ℹ️ 参加していません。", ephemeral=True)
+
+
+class PomoView(View):
+    # 表示用のみ。押下は bot.add_dynamic_items で登録した PomoButton が受けるため、送信後は保持されない
+    def __init__(self, author_id: int, paused: bool = False):
+        super().__init__(timeout=None)
+        self.add_item(PomoButton("pause", author_id, disabled=paused))
+        self.add_item(PomoButton("resume", author_id, disabled=not paused))
+        self.add_item(PomoButton("stop", author_id))
+
+
+class JoinView(View):
+    def __init__(self, author_id: int, disabled: bool = False):
+        super().__init__(timeout=None)
+        self.add_item(JoinButton("join", author_id, disabled=disabled))
+        self.add_item(JoinButton("leave", author_id, disabled=disabled))
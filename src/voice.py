@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import discord
+
+
+class VoicePool:
+    # セッション終了後もVC接続をしばらく残し、次の !pomo で接続の握手を省く
+    IDLE_SECONDS = 300.0
+    REAP_INTERVAL_SECONDS = 30.0
+    # Discordの仕様でBotの音声接続はギルドごとに1本なので、待機接続の上限は全ギルド合計で数える
+    MAX_IDLE = 50
+
+    def __init__(
+        self,
+        idle_seconds: float = IDLE_SECONDS,
+        max_idle: int = MAX_IDLE,
+        reap_interval: float = REAP_INTERVAL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.idle_seconds = idle_seconds
+        self.max_idle = max_idle
+        self.reap_interval = reap_interval
+        self.clock = clock
+        # guild_id -> この接続を使っているセッション数
+        self._users: dict[int, int] = {}
+        # guild_id -> (待機開始時刻, VoiceClient)。古い順
+        self._idle: OrderedDict[int, tuple[float, discord.VoiceClient]] = OrderedDict()
+        self._reap_task: asyncio.Task | None = None
+        self.connects = 0
+        self.reconnects = 0
+        self.reuses = 0
+        self.reaped = 0
+
+    async def acquire(self, channel: discord.VoiceChannel) -> discord.VoiceClient:
+        guild = channel.guild
+        self._idle.pop(guild.id, None)
+        voice_client = guild.voice_client
+        if voice_client is not None and not voice_client.is_connected():
+            # 切れたまま残っている接続は張り直す
+            self.reconnects += 1
+            try:
+                await voice_client.disconnect(force=True)
+            except Exception:
+                pass
+            voice_client = None
+
+        if voice_client is None:
+            voice_client = await channel.connect(reconnect=True)
+            self.connects += 1
+        else:
+            if voice_client.channel != channel:
+                await voice_client.move_to(channel)
+            self.reuses += 1
+        self._users[guild.id] = self._users.get(guild.id, 0) + 1
+        return voice_client
+
+    def busy_elsewhere(self, channel: discord.VoiceChannel) -> bool:
+        # 別のチャンネルでセッションが使っている接続は acquire すると移動してしまう
+        voice_client = channel.guild.voice_client
+        return (
+            self._users.get(channel.guild.id, 0) > 0
+            and voice_client is not None
+            and voice_client.channel != channel
+        )
+
+    async def release(self, voice_client: discord.VoiceClient | None) -> None:
+        if voice_client is None:
+            return
+        guild_id = voice_client.guild.id
+        users = self._users.get(guild_id, 0) - 1
+        if users > 0:
+            self._users[guild_id] = users
+            return
+        self._users.pop(guild_id, None)
+
+        if self.idle_seconds <= 0 or self.max_idle <= 0:
+            await self._disconnect(voice_client)
+            return
+        self._idle[guild_id] = (self.clock(), voice_client)
+        self._idle.move_to_end(guild_id)
+        while len(self._idle) > self.max_idle:
+            _, (_, oldest) = self._idle.popitem(last=False)
+            await self._disconnect(oldest)
+        if self._reap_task is None:
+            self._reap_task = asyncio.create_task(self._reap_loop())
+
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    async def reap(self, now: float | None = None) -> int:
+        now = self.clock() if now is None else now
+        expired = [
+            guild_id
+            for guild_id, (since, voice_client) in self._idle.items()
+            if now - since >= self.idle_seconds or not voice_client.is_connected()
+        ]
+        for guild_id in expired:
+            _, voice_client = self._idle.pop(guild_id)
+            await self._disconnect(voice_client)
+        return len(expired)
+
+    async def close(self) -> None:
+        if self._reap_task is not None:
+            self._reap_task.cancel()
+            self._reap_task = None
+        while self._idle:
+            _, (_, voice_client) = self._idle.popitem(last=False)
+            await self._disconnect(voice_client)
+
+    async def _disconnect(self, voice_client: discord.VoiceClient) -> None:
+        self.reaped += 1
+        try:
+            await voice_client.disconnect(force=True)
+        except Exception as e:
+            print(f"[DEBUG] VC切断に失敗しました (guild={voice_client.guild.id}): {e}")
+
+    async def _reap_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                print(f"[DEBUG] 待機中VC接続の整理に失敗しました: {e}")